@@ -1,25 +1,55 @@
 from fastapi import APIRouter, HTTPException, Depends, Query, Form, Request
-from fastapi.responses import RedirectResponse, JSONResponse
+from fastapi.responses import RedirectResponse, ORJSONResponse, Response
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select
+from sqlalchemy import select, update, insert, delete
 from pydantic import BaseModel
 from typing import List, Optional, Dict, Any
 from urllib.parse import urlencode
 import uuid
+import secrets
 import time
 import jwt
+import httpx
+import orjson
 import hashlib
+import hmac
 import base64
 import re
 from datetime import datetime, timedelta
 
 from app.core.database import get_db
+from app.core.http import get_http_client
 from app.core.config import settings
-from app.core.security import encrypt_token, decrypt_token
-from app.models.oauth import OAuth2Client, AuthorizationRequest, AuthorizationCodeGrant, AccessToken
+from app.core.security import (
+    encrypt_token, decrypt_token, generate_developer_token,
+    seal_payload, unseal_payload
+)
+from app.core.cache import refresh_token_cache, refresh_token_key
+from app.models.oauth import OAuth2Client, AuthorizationCodeGrant, AccessToken
 
 router = APIRouter()
 
+# Allowed redirect URI patterns for dynamic client registration, compiled once
+_REDIRECT_PATTERNS = tuple(re.compile(pattern) for pattern in [
+    r"^http://localhost:\d+/.*$",
+    r"^http://127\.0\.0\.1:\d+/.*$",
+    r"^https://claude\.ai/.*$",
+    r"^https://.*\.claude\.ai/.*$"
+])
+
+# AccessToken columns needed to serve a refresh grant, cached per refresh token
+_TOKEN_CACHE_COLUMNS = (
+    AccessToken.access_token_jti,
+    AccessToken.client_id,
+    AccessToken.scope,
+    AccessToken.apple_user_token,
+    AccessToken.apple_refresh_token
+)
+
+def request_time() -> datetime:
+    """Dependency providing a single UTC timestamp shared across one request"""
+    return datetime.utcnow()
+
 # Add OPTIONS handlers for CORS preflight requests
 @router.options("/.well-known/oauth-authorization-server")
 @router.options("/.well-known/oauth-protected-resource")
@@ -29,7 +59,7 @@ router = APIRouter()
 @router.options("/{path:path}")
 async def options_handler(request: Request):
     """Handle OPTIONS requests for CORS preflight"""
-    return JSONResponse(
+    return ORJSONResponse(
         content={},
         headers={
             "Access-Control-Allow-Origin": "*",
@@ -64,32 +94,40 @@ class TokenResponse(BaseModel):
     refresh_token: Optional[str] = None
     scope: Optional[str] = None
 
+# OAuth 2.1 Authorization Server Metadata only depends on settings, so it is
+# serialized once at import and served as raw bytes
+_OAUTH_METADATA_BYTES = orjson.dumps({
+    "issuer": settings.oauth_base_url,
+    "authorization_endpoint": f"{settings.oauth_base_url}/oauth/authorize",
+    "token_endpoint": f"{settings.oauth_base_url}/oauth/token",
+    "registration_endpoint": f"{settings.oauth_base_url}/oauth/register",
+    "revocation_endpoint": f"{settings.oauth_base_url}/oauth/revoke",
+    "scopes_supported": [
+        "library:read",
+        "library:write", 
+        "playlists:read",
+        "playlists:write",
+        "recently-played:read"
+    ],
+    "response_types_supported": ["code"],
+    "grant_types_supported": ["authorization_code", "refresh_token"],
+    "code_challenge_methods_supported": ["S256"],
+    "token_endpoint_auth_methods_supported": ["none"],
+    "token_endpoint_auth_method": "none",
+    "require_pushed_authorization_requests": False
+})
+
 @router.get("/.well-known/oauth-authorization-server")
 async def oauth_metadata():
     """
     OAuth 2.1 Authorization Server Metadata (RFC 8414)
     Claude uses this for automatic endpoint discovery
     """
-    return {
-        "issuer": settings.oauth_base_url,
-        "authorization_endpoint": f"{settings.oauth_base_url}/oauth/authorize",
-        "token_endpoint": f"{settings.oauth_base_url}/oauth/token",
-        "registration_endpoint": f"{settings.oauth_base_url}/oauth/register",
-        "revocation_endpoint": f"{settings.oauth_base_url}/oauth/revoke",
-        "scopes_supported": [
-            "library:read",
-            "library:write", 
-            "playlists:read",
-            "playlists:write",
-            "recently-played:read"
-        ],
-        "response_types_supported": ["code"],
-        "grant_types_supported": ["authorization_code", "refresh_token"],
-        "code_challenge_methods_supported": ["S256"],
-        "token_endpoint_auth_methods_supported": ["none"],
-        "token_endpoint_auth_method": "none",
-        "require_pushed_authorization_requests": False
-    }
+    return Response(
+        content=_OAUTH_METADATA_BYTES,
+        media_type="application/json",
+        headers={"Cache-Control": "public, max-age=3600"}
+    )
 
 @router.get("/.well-known/oauth-protected-resource")
 async def oauth_protected_resource_metadata():
@@ -114,7 +152,8 @@ async def oauth_protected_resource_metadata():
 @router.post("/oauth/register", response_model=ClientRegistrationResponse)
 async def dynamic_client_registration(
     request: ClientRegistrationRequest,
-    db: AsyncSession = Depends(get_db)
+    db: AsyncSession = Depends(get_db),
+    now: datetime = Depends(request_time)
 ):
     """
     Dynamic Client Registration (RFC 7591)
@@ -126,30 +165,21 @@ async def dynamic_client_registration(
     client_issued_at = int(time.time())
     
     # Validate redirect URIs - Claude typically uses localhost ports or claude.ai domains
-    allowed_patterns = [
-        r"^http://localhost:\d+/.*$",
-        r"^http://127\.0\.0\.1:\d+/.*$", 
-        r"^https://claude\.ai/.*$",
-        r"^https://.*\.claude\.ai/.*$"
-    ]
-    
     for uri in request.redirect_uris:
-        if not any(re.match(pattern, uri) for pattern in allowed_patterns):
+        if not any(pattern.match(uri) for pattern in _REDIRECT_PATTERNS):
             raise HTTPException(400, f"Invalid redirect URI: {uri}")
     
     # Store client registration
     client = OAuth2Client(
         client_id=client_id,
         client_name=request.client_name or "Claude MCP Client",
+        redirect_uris=request.redirect_uris,
+        grant_types=request.grant_types,
+        response_types=request.response_types,
         scope=request.scope,
-        created_at=datetime.utcnow()
+        created_at=now
     )
     
-    # Set list properties using the custom setters
-    client.redirect_uris_list = request.redirect_uris
-    client.grant_types_list = request.grant_types
-    client.response_types_list = request.response_types
-    
     db.add(client)
     await db.commit()
     
@@ -188,42 +218,63 @@ async def oauth_authorize(
         raise HTTPException(400, "Invalid client_id")
     
     # Validate redirect_uri
-    if redirect_uri not in client.redirect_uris_list:
+    if redirect_uri not in (client.redirect_uris or []):
         raise HTTPException(400, "Invalid redirect_uri")
     
     # Validate PKCE
     if code_challenge_method != "S256":
         raise HTTPException(400, "Only S256 code_challenge_method supported")
     
-    # Store authorization request temporarily
-    auth_request_id = str(uuid.uuid4())
-    auth_request = AuthorizationRequest(
-        id=auth_request_id,
-        client_id=client_id,
-        redirect_uri=redirect_uri,
-        scope=scope,
-        state=state or auth_request_id,  # Use auth_request_id if no state provided
-        code_challenge=code_challenge,
-        code_challenge_method=code_challenge_method,
-        expires_at=datetime.utcnow() + timedelta(minutes=10)
-    )
-    
-    db.add(auth_request)
-    await db.commit()
-    
-    # Generate developer token for MusicKit
-    from app.core.security import generate_developer_token
-    developer_token = generate_developer_token()
-    
-    # Redirect to our MusicKit authentication page
-    musickit_auth_url = f"{settings.oauth_base_url}/static/musickit-auth.html?auth_request_id={auth_request_id}&developer_token={developer_token}"
+    # Carry the authorization request through the browser as a sealed,
+    # timestamped payload instead of storing it in the database
+    auth_request_id = seal_payload({
+        "client_id": client_id,
+        "redirect_uri": redirect_uri,
+        "scope": scope,
+        "state": state or secrets.token_urlsafe(16),
+        "code_challenge": code_challenge,
+        "code_challenge_method": code_challenge_method
+    })
+    
+    # Redirect to our MusicKit authentication page - the page fetches the
+    # developer token itself, keeping it out of the URL and browser history
+    musickit_auth_url = f"{settings.oauth_base_url}/static/musickit-auth.html?" + urlencode({
+        "auth_request_id": auth_request_id
+    })
     
     return RedirectResponse(url=musickit_auth_url, status_code=302)
 
+# Keys every authorization request sealed by /oauth/authorize carries
+_AUTH_REQUEST_KEYS = frozenset({
+    "client_id", "redirect_uri", "scope", "state", "code_challenge", "code_challenge_method"
+})
+
+def _load_authorization_request(auth_request_id: str) -> Optional[Dict[str, Any]]:
+    """Unseal an authorization request, returning None if invalid or expired"""
+    auth_request = unseal_payload(auth_request_id, ttl=settings.authorization_code_lifetime)
+    if auth_request is None or not _AUTH_REQUEST_KEYS <= auth_request.keys():
+        return None
+    return auth_request
+
+@router.get("/oauth/musickit/developer-token")
+async def musickit_developer_token(auth_request_id: Optional[str] = None):
+    """
+    Developer token for configuring MusicKit JS on the authentication page
+    Only issued for an authorization request sealed by /oauth/authorize
+    """
+    if not auth_request_id or not _load_authorization_request(auth_request_id):
+        raise HTTPException(400, "Invalid or expired authorization request")
+    
+    return ORJSONResponse(
+        content={"developer_token": generate_developer_token()},
+        headers={"Cache-Control": "no-store"}
+    )
+
 @router.post("/oauth/musickit/callback")
 async def musickit_callback(
     request: Dict[str, Any],
-    db: AsyncSession = Depends(get_db)
+    db: AsyncSession = Depends(get_db),
+    now: datetime = Depends(request_time)
 ):
     """
     Handle MusicKit user token from JavaScript
@@ -236,33 +287,27 @@ async def musickit_callback(
     if not auth_request_id or not user_token:
         raise HTTPException(400, "Missing auth_request_id or user_token")
     
-    # Retrieve stored authorization request
-    result = await db.execute(
-        select(AuthorizationRequest).where(
-            AuthorizationRequest.id == auth_request_id,
-            AuthorizationRequest.expires_at > datetime.utcnow()
-        )
-    )
-    auth_request = result.scalar_one_or_none()
+    # Recover the authorization request sealed by /oauth/authorize
+    auth_request = _load_authorization_request(auth_request_id)
     
     if not auth_request:
         raise HTTPException(400, "Invalid or expired authorization request")
     
     try:
         # Generate our own authorization code for Claude
-        our_auth_code = str(uuid.uuid4())
+        our_auth_code = secrets.token_urlsafe(16)
         
         # Store the authorization code mapping with MusicKit user token
         code_grant = AuthorizationCodeGrant(
             code=our_auth_code,
-            client_id=auth_request.client_id,
-            redirect_uri=auth_request.redirect_uri,
-            scope=auth_request.scope,
-            code_challenge=auth_request.code_challenge,
-            code_challenge_method=auth_request.code_challenge_method,
-            apple_user_token=user_token,  # This is the MusicKit user token
+            client_id=auth_request["client_id"],
+            redirect_uri=auth_request["redirect_uri"],
+            scope=auth_request["scope"],
+            code_challenge=auth_request["code_challenge"],
+            code_challenge_method=auth_request["code_challenge_method"],
+            apple_user_token=encrypt_token(user_token),  # This is the MusicKit user token
             apple_refresh_token=None,  # MusicKit doesn't provide refresh tokens
-            expires_at=datetime.utcnow() + timedelta(minutes=10)
+            expires_at=now + timedelta(minutes=10)
         )
         
         db.add(code_grant)
@@ -271,10 +316,10 @@ async def musickit_callback(
         # Return redirect URL for JavaScript to handle
         claude_callback_params = {
             "code": our_auth_code,
-            "state": auth_request.state
+            "state": auth_request["state"]
         }
         
-        redirect_url = f"{auth_request.redirect_uri}?" + urlencode(claude_callback_params)
+        redirect_url = f"{auth_request['redirect_uri']}?" + urlencode(claude_callback_params)
         
         return {"redirect_url": redirect_url, "status": "success"}
         
@@ -283,53 +328,50 @@ async def musickit_callback(
         error_params = {
             "error": "server_error",
             "error_description": "Failed to process MusicKit authentication",
-            "state": auth_request.state
+            "state": auth_request["state"]
         }
         
-        error_url = f"{auth_request.redirect_uri}?" + urlencode(error_params)
+        error_url = f"{auth_request['redirect_uri']}?" + urlencode(error_params)
         return {"redirect_url": error_url, "status": "error", "message": str(e)}
 
 @router.get("/oauth/apple/callback")
 async def apple_oauth_callback(
     code: str = Query(...),
-    state: str = Query(...),  # This is our auth_request_id
-    db: AsyncSession = Depends(get_db)
+    state: str = Query(...),  # This is our sealed auth_request_id
+    db: AsyncSession = Depends(get_db),
+    http_client: httpx.AsyncClient = Depends(get_http_client),
+    now: datetime = Depends(request_time)
 ):
     """
     Handle callback from Apple Music OAuth
     Exchange Apple code for user token, then redirect back to Claude
     """
     
-    # Retrieve stored authorization request
-    result = await db.execute(
-        select(AuthorizationRequest).where(
-            AuthorizationRequest.id == state,
-            AuthorizationRequest.expires_at > datetime.utcnow()
-        )
-    )
-    auth_request = result.scalar_one_or_none()
+    # Recover the authorization request - this is an offline decrypt, so
+    # invalid requests are rejected before calling Apple
+    auth_request = _load_authorization_request(state)
     
     if not auth_request:
         raise HTTPException(400, "Invalid or expired authorization request")
     
     try:
         # Exchange Apple authorization code for user token
-        apple_token_response = await exchange_apple_authorization_code(code)
+        apple_token_response = await exchange_apple_authorization_code(code, http_client)
         
         # Generate our own authorization code for Claude
-        our_auth_code = str(uuid.uuid4())
+        our_auth_code = secrets.token_urlsafe(16)
         
         # Store the authorization code mapping
         code_grant = AuthorizationCodeGrant(
             code=our_auth_code,
-            client_id=auth_request.client_id,
-            redirect_uri=auth_request.redirect_uri,
-            scope=auth_request.scope,
-            code_challenge=auth_request.code_challenge,
-            code_challenge_method=auth_request.code_challenge_method,
-            apple_user_token=apple_token_response["access_token"],
-            apple_refresh_token=apple_token_response.get("refresh_token"),
-            expires_at=datetime.utcnow() + timedelta(minutes=10)
+            client_id=auth_request["client_id"],
+            redirect_uri=auth_request["redirect_uri"],
+            scope=auth_request["scope"],
+            code_challenge=auth_request["code_challenge"],
+            code_challenge_method=auth_request["code_challenge_method"],
+            apple_user_token=encrypt_token(apple_token_response["access_token"]),
+            apple_refresh_token=encrypt_token(apple_token_response["refresh_token"]) if apple_token_response.get("refresh_token") else None,
+            expires_at=now + timedelta(minutes=10)
         )
         
         db.add(code_grant)
@@ -338,11 +380,11 @@ async def apple_oauth_callback(
         # Redirect back to Claude with our authorization code
         claude_callback_params = {
             "code": our_auth_code,
-            "state": auth_request.state
+            "state": auth_request["state"]
         }
         
         claude_callback_url = (
-            f"{auth_request.redirect_uri}?" + urlencode(claude_callback_params)
+            f"{auth_request['redirect_uri']}?" + urlencode(claude_callback_params)
         )
         
         return RedirectResponse(url=claude_callback_url, status_code=302)
@@ -352,33 +394,30 @@ async def apple_oauth_callback(
         error_params = {
             "error": "server_error",
             "error_description": "Failed to authenticate with Apple Music",
-            "state": auth_request.state
+            "state": auth_request["state"]
         }
         
-        error_url = f"{auth_request.redirect_uri}?" + urlencode(error_params)
+        error_url = f"{auth_request['redirect_uri']}?" + urlencode(error_params)
         return RedirectResponse(url=error_url, status_code=302)
 
-async def exchange_apple_authorization_code(code: str) -> Dict[str, Any]:
+async def exchange_apple_authorization_code(code: str, client: httpx.AsyncClient) -> Dict[str, Any]:
     """Exchange Apple authorization code for user token"""
-    import httpx
-    
-    async with httpx.AsyncClient() as client:
-        response = await client.post(
-            "https://appleid.apple.com/auth/token",
-            data={
-                "client_id": settings.apple_client_id,
-                "client_secret": settings.apple_client_secret,
-                "code": code,
-                "grant_type": "authorization_code",
-                "redirect_uri": f"{settings.oauth_base_url}/oauth/apple/callback"
-            },
-            headers={"Content-Type": "application/x-www-form-urlencoded"}
-        )
-        
-        if response.status_code != 200:
-            raise Exception(f"Apple OAuth failed: {response.text}")
-        
-        return response.json()
+    response = await client.post(
+        "https://appleid.apple.com/auth/token",
+        data={
+            "client_id": settings.apple_client_id,
+            "client_secret": settings.apple_client_secret,
+            "code": code,
+            "grant_type": "authorization_code",
+            "redirect_uri": f"{settings.oauth_base_url}/oauth/apple/callback"
+        },
+        headers={"Content-Type": "application/x-www-form-urlencoded"}
+    )
+    
+    if response.status_code != 200:
+        raise Exception(f"Apple OAuth failed: {response.text}")
+    
+    return orjson.loads(response.content)
 
 @router.post("/oauth/token", response_model=TokenResponse)
 async def oauth_token(
@@ -387,7 +426,8 @@ async def oauth_token(
     refresh_token: Optional[str] = Form(None),
     client_id: str = Form(...),
     code_verifier: Optional[str] = Form(None),
-    db: AsyncSession = Depends(get_db)
+    db: AsyncSession = Depends(get_db),
+    now: datetime = Depends(request_time)
 ):
     """
     OAuth Token Endpoint
@@ -396,11 +436,11 @@ async def oauth_token(
     
     if grant_type == "authorization_code":
         return await handle_authorization_code_grant(
-            code, client_id, code_verifier, db
+            code, client_id, code_verifier, db, now
         )
     elif grant_type == "refresh_token":
         return await handle_refresh_token_grant(
-            refresh_token, client_id, db
+            refresh_token, client_id, db, now
         )
     else:
         raise HTTPException(400, "Unsupported grant_type")
@@ -409,39 +449,53 @@ async def handle_authorization_code_grant(
     code: str, 
     client_id: str, 
     code_verifier: str, 
-    db: AsyncSession
+    db: AsyncSession,
+    now: datetime
 ) -> TokenResponse:
     """Handle authorization_code grant type"""
     
-    # Retrieve and validate authorization code
+    # Claim the authorization code - fetching and deleting it in a single
+    # statement makes codes strictly single-use, even under concurrent replay
     result = await db.execute(
-        select(AuthorizationCodeGrant).where(
+        delete(AuthorizationCodeGrant).where(
             AuthorizationCodeGrant.code == code,
             AuthorizationCodeGrant.client_id == client_id,
-            AuthorizationCodeGrant.expires_at > datetime.utcnow()
-        )
+            AuthorizationCodeGrant.expires_at > now
+        ).returning(AuthorizationCodeGrant)
     )
     code_grant = result.scalar_one_or_none()
     
     if not code_grant:
         raise HTTPException(400, "Invalid or expired authorization code")
     
-    # Verify PKCE code_verifier
-    expected_challenge = base64.urlsafe_b64encode(
-        hashlib.sha256(code_verifier.encode()).digest()
-    ).decode().rstrip('=')
+    # Verify PKCE code_verifier - on failure, roll back so the code isn't burned
+    if not code_verifier:
+        await db.rollback()
+        raise HTTPException(400, "Invalid code_verifier")
     
-    if expected_challenge != code_grant.code_challenge:
+    # A base64 SHA-256 digest is always 44 chars ending in a single '=' pad
+    digest = hashlib.sha256(code_verifier.encode()).digest()
+    expected_challenge = base64.urlsafe_b64encode(digest)[:-1]
+    
+    # Constant-time compare so the challenge can't be probed via timing
+    if not hmac.compare_digest(expected_challenge, (code_grant.code_challenge or "").encode()):
+        await db.rollback()
         raise HTTPException(400, "Invalid code_verifier")
     
+    # Apple tokens are encrypted once when the grant is created, so the stored
+    # ciphertext goes straight into the access token and the token record
+    apple_user_token = code_grant.apple_user_token
+    apple_refresh_token = code_grant.apple_refresh_token
+    
     # Generate access token with encrypted Apple token
+    issued_at = int(time.time())
     access_token_payload = {
         "sub": client_id,
-        "apple_user_token": encrypt_token(code_grant.apple_user_token),
-        "apple_refresh_token": encrypt_token(code_grant.apple_refresh_token) if code_grant.apple_refresh_token else None,
+        "apple_user_token": apple_user_token,
+        "apple_refresh_token": apple_refresh_token,
         "scope": code_grant.scope,
-        "iat": int(time.time()),
-        "exp": int(time.time()) + settings.access_token_lifetime,
+        "iat": issued_at,
+        "exp": issued_at + settings.access_token_lifetime,
         "token_type": "Bearer"
     }
     
@@ -452,25 +506,28 @@ async def handle_authorization_code_grant(
     )
     
     # Generate refresh token
-    refresh_token = str(uuid.uuid4())
-    
-    # Store tokens
-    token_record = AccessToken(
-        access_token_jti=str(uuid.uuid4()),
-        refresh_token=refresh_token,
-        client_id=client_id,
-        scope=code_grant.scope,
-        apple_user_token=code_grant.apple_user_token,
-        apple_refresh_token=code_grant.apple_refresh_token,
-        expires_at=datetime.utcnow() + timedelta(seconds=settings.access_token_lifetime)
-    )
-    
-    db.add(token_record)
+    refresh_token = secrets.token_urlsafe(16)
+    
+    # Store tokens with a Core insert, skipping the ORM unit-of-work for this
+    # write-only path
+    token_row = {
+        "access_token_jti": secrets.token_urlsafe(16),
+        "refresh_token": refresh_token,
+        "client_id": client_id,
+        "scope": code_grant.scope,
+        "apple_user_token": apple_user_token,
+        "apple_refresh_token": apple_refresh_token,
+        "expires_at": now + timedelta(seconds=settings.access_token_lifetime)
+    }
     
-    # Clean up authorization code
-    await db.delete(code_grant)
+    await db.execute(insert(AccessToken), [token_row])
     await db.commit()
     
+    # Warm the refresh token cache so the first refresh skips the DB lookup
+    refresh_token_cache[refresh_token_key(refresh_token)] = {
+        column.key: token_row[column.key] for column in _TOKEN_CACHE_COLUMNS
+    }
+    
     return TokenResponse(
         access_token=access_token,
         token_type="Bearer",
@@ -482,33 +539,59 @@ async def handle_authorization_code_grant(
 async def handle_refresh_token_grant(
     refresh_token: str,
     client_id: str,
-    db: AsyncSession
+    db: AsyncSession,
+    now: datetime
 ) -> TokenResponse:
     """Handle refresh_token grant type"""
     
-    # Find the refresh token
+    # Look the refresh token up in the cache first, falling back to the DB
+    cache_key = refresh_token_key(refresh_token)
+    token_data = refresh_token_cache.get(cache_key)
+    
+    if token_data is None:
+        result = await db.execute(
+            select(*_TOKEN_CACHE_COLUMNS).where(
+                AccessToken.refresh_token == refresh_token,
+                AccessToken.client_id == client_id
+            )
+        )
+        token_row = result.mappings().first()
+        
+        if not token_row:
+            raise HTTPException(400, "Invalid refresh token")
+        
+        token_data = dict(token_row)
+        refresh_token_cache[cache_key] = token_data
+    elif token_data["client_id"] != client_id:
+        raise HTTPException(400, "Invalid refresh token")
+    
+    # Update token record. This also confirms the grant still exists, so a cached
+    # entry for a revoked or deleted token is caught here rather than trusted
     result = await db.execute(
-        select(AccessToken).where(
-            AccessToken.refresh_token == refresh_token,
-            AccessToken.client_id == client_id
+        update(AccessToken)
+        .where(
+            AccessToken.access_token_jti == token_data["access_token_jti"],
+            AccessToken.refresh_token == refresh_token
         )
+        .values(expires_at=now + timedelta(seconds=settings.access_token_lifetime))
     )
-    token_record = result.scalar_one_or_none()
-    
-    if not token_record:
+    if result.rowcount == 0:
+        refresh_token_cache.pop(cache_key, None)
         raise HTTPException(400, "Invalid refresh token")
+    await db.commit()
     
     # TODO: Refresh Apple Music token if needed
     # For now, reuse existing Apple token
     
-    # Generate new access token
+    # Generate new access token, reusing the stored Apple token ciphertext
+    issued_at = int(time.time())
     access_token_payload = {
         "sub": client_id,
-        "apple_user_token": encrypt_token(token_record.apple_user_token),
-        "apple_refresh_token": encrypt_token(token_record.apple_refresh_token) if token_record.apple_refresh_token else None,
-        "scope": token_record.scope,
-        "iat": int(time.time()),
-        "exp": int(time.time()) + settings.access_token_lifetime,
+        "apple_user_token": token_data["apple_user_token"],
+        "apple_refresh_token": token_data["apple_refresh_token"],
+        "scope": token_data["scope"],
+        "iat": issued_at,
+        "exp": issued_at + settings.access_token_lifetime,
         "token_type": "Bearer"
     }
     
@@ -518,14 +601,10 @@ async def handle_refresh_token_grant(
         algorithm="HS256"
     )
     
-    # Update token record
-    token_record.expires_at = datetime.utcnow() + timedelta(seconds=settings.access_token_lifetime)
-    await db.commit()
-    
     return TokenResponse(
         access_token=new_access_token,
         token_type="Bearer",
         expires_in=settings.access_token_lifetime,
         refresh_token=refresh_token,  # Reuse same refresh token
-        scope=token_record.scope
-    )
\ No newline at end of file
+        scope=token_data["scope"]
+    )
@@ -0,0 +1,81 @@
+import asyncio
+import hashlib
+from typing import Any, Awaitable, Callable, Dict, Hashable, Tuple
+from cachetools import TTLCache
+
+from app.core.config import settings
+
+# In-process cache of refresh token records so the refresh grant can skip the
+# SQLite lookup. Entries live as long as the refresh token itself.
+refresh_token_cache: TTLCache = TTLCache(
+    maxsize=10000,
+    ttl=settings.refresh_token_lifetime
+)
+
+# Catalog responses (search, charts) are the same for every user, so repeated
+# tool calls within a few minutes are served from memory
+catalog_cache: TTLCache = TTLCache(maxsize=1024, ttl=300)
+
+# Per-user library totals change slowly, so serve repeat get_library_stats calls from memory
+library_stats_cache: TTLCache = TTLCache(maxsize=1024, ttl=120)
+
+# Per-user index of lowercased library playlist name -> playlist ID, so name lookups
+# don't refetch and rescan the playlist list. Dropped whenever the user creates a playlist
+playlist_index_cache: TTLCache = TTLCache(maxsize=1024, ttl=60)
+
+# Simplified search_songs results keyed by normalized (query, limit). Queries that
+# match nothing are remembered for longer, since LLM clients tend to retry them
+song_search_cache: TTLCache = TTLCache(maxsize=10000, ttl=600)
+empty_search_cache: TTLCache = TTLCache(maxsize=10000, ttl=3600)
+
+# Verified access tokens -> (MusicKit user token, exp), keyed by user_cache_key digest.
+# MCP clients present the same access token on every call, so only the first call pays
+# for JWT verification and decryption. Entries never outlive the token's own lifetime;
+# exp is checked on read.
+access_token_cache: TTLCache = TTLCache(
+    maxsize=4096,
+    ttl=settings.access_token_lifetime
+)
+
+# Fetches currently in flight, so concurrent misses for the same key share one upstream call
+_inflight: Dict[Tuple[int, Hashable], asyncio.Task] = {}
+
+async def get_or_fetch(cache: TTLCache, key: Hashable, fetch: Callable[[], Awaitable[Any]]) -> Any:
+    """Return a cached value, fetching it once on a miss even when many callers miss together"""
+    cached = cache.get(key)
+    if cached is not None:
+        return cached
+    
+    # Join an identical fetch already in flight instead of issuing another. The fetch
+    # runs in its own task and every caller waits through a shield, so cancelling
+    # any caller - including the one that started it - never cancels the others
+    inflight_key = (id(cache), key)
+    task = _inflight.get(inflight_key)
+    if task is None:
+        task = asyncio.create_task(_fetch_into(cache, key, inflight_key, fetch))
+        task.add_done_callback(_retrieve_exception)
+        _inflight[inflight_key] = task
+    return await asyncio.shield(task)
+
+async def _fetch_into(cache: TTLCache, key: Hashable, inflight_key: Tuple[int, Hashable],
+                      fetch: Callable[[], Awaitable[Any]]) -> Any:
+    """Run a shared fetch and store its result in the cache"""
+    try:
+        result = await fetch()
+        cache[key] = result
+        return result
+    finally:
+        del _inflight[inflight_key]
+
+def _retrieve_exception(task: asyncio.Task):
+    """Mark a failed fetch's exception as retrieved - every waiter may have gone away"""
+    if not task.cancelled():
+        task.exception()
+
+def user_cache_key(user_token: str) -> bytes:
+    """Cache key for per-user data (the raw user token is never used as a key)"""
+    return hashlib.blake2b(user_token.encode(), digest_size=16).digest()
+
+def refresh_token_key(refresh_token: str) -> str:
+    """Cache key for a refresh token (the raw token is never used as a key)"""
+    return "rt:" + hashlib.sha256(refresh_token.encode()).hexdigest()
@@ -1,3 +1,4 @@
+from functools import lru_cache
 from pydantic_settings import BaseSettings
 from typing import Optional
 
@@ -7,11 +8,15 @@ class Settings(BaseSettings):
     apple_key_id: str  
     apple_private_key_path: str = "/keys/AuthKey.p8"
     
+    # Sign in with Apple (only needed for the /oauth/apple/callback flow)
+    apple_client_id: Optional[str] = None
+    apple_client_secret: Optional[str] = None
     
     # Server Configuration
     server_host: str = "0.0.0.0"
     server_port: int = 3600
     debug: bool = False
+    server_workers: Optional[int] = None  # Defaults to one per CPU (one for SQLite); ignored in debug/reload mode
     oauth_port: int = 443  # Port for OAuth URLs (443 for HTTPS, 80 for HTTP)
     @property
     def oauth_base_url(self) -> str:
@@ -42,4 +47,9 @@ class Settings(BaseSettings):
     class Config:
         env_file = ".env"
 
-settings = Settings()
\ No newline at end of file
+@lru_cache
+def get_settings() -> Settings:
+    """Load settings once - .env parsing and validation run a single time"""
+    return Settings()
+
+settings = get_settings()
@@ -1,9 +1,13 @@
-from sqlalchemy import create_engine
+import orjson
+from cryptography.fernet import InvalidToken
+from sqlalchemy import create_engine, event, select, update
+from sqlalchemy.pool import AsyncAdaptedQueuePool, StaticPool
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
 
 from app.core.config import settings
+from app.core.security import ENCRYPTED_TOKEN_PREFIX, decrypt_token, encrypt_token
 
 # Convert SQLite URL to async format
 if settings.database_url.startswith("sqlite:///"):
@@ -11,13 +15,48 @@ if settings.database_url.startswith("sqlite:///"):
 else:
     async_database_url = settings.database_url
 
+is_sqlite = "sqlite" in async_database_url
+is_sqlite_memory = is_sqlite and (":memory:" in async_database_url or async_database_url.endswith("://"))
+
+# Pool configuration - aiosqlite defaults to NullPool for file databases, which
+# opens a fresh connection for every session, so use a real pool instead
+if is_sqlite_memory:
+    # In-memory databases only exist per connection, so share a single one
+    pool_kwargs = {"poolclass": StaticPool}
+else:
+    pool_kwargs = {
+        "pool_size": 20,
+        "max_overflow": 10
+    }
+    if is_sqlite:
+        pool_kwargs["poolclass"] = AsyncAdaptedQueuePool
+    else:
+        # Network databases can drop idle connections; a local SQLite file never goes stale
+        pool_kwargs["pool_pre_ping"] = True
+
 # Create async database engine
 engine = create_async_engine(
     async_database_url,
     echo=settings.debug,
-    connect_args={"check_same_thread": False} if "sqlite" in async_database_url else {}
+    # JSON columns go through orjson rather than the stdlib json module
+    json_serializer=lambda obj: orjson.dumps(obj).decode(),
+    json_deserializer=orjson.loads,
+    connect_args={"check_same_thread": False} if is_sqlite else {},
+    **pool_kwargs
 )
 
+if is_sqlite:
+    @event.listens_for(engine.sync_engine, "connect")
+    def _set_sqlite_pragmas(dbapi_connection, connection_record):
+        """Use WAL so readers don't block on writers, plus cache/mmap tuning"""
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute("PRAGMA synchronous=NORMAL")
+        cursor.execute("PRAGMA temp_store=MEMORY")
+        cursor.execute("PRAGMA mmap_size=268435456")
+        cursor.execute("PRAGMA cache_size=-64000")
+        cursor.close()
+
 # Create async session factory
 AsyncSessionLocal = sessionmaker(
     engine, class_=AsyncSession, expire_on_commit=False
@@ -38,7 +77,49 @@ async def get_db():
         finally:
             await session.close()
 
+def _create_missing_indexes(sync_conn):
+    """Create indexes added to models after their tables already existed"""
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(sync_conn, checkfirst=True)
+
+# Tables and columns holding Apple tokens that must be encrypted at rest
+_ENCRYPTED_TOKEN_COLUMNS = {
+    "authorization_code_grants": ("apple_user_token", "apple_refresh_token"),
+    "access_tokens": ("apple_user_token", "apple_refresh_token")
+}
+
+def _mark_encrypted(token: str) -> str:
+    """Encrypt a legacy stored token, or just mark it if it is already bare ciphertext"""
+    try:
+        decrypt_token(token)
+    except InvalidToken:
+        return encrypt_token(token)
+    return ENCRYPTED_TOKEN_PREFIX + token
+
+def _encrypt_plaintext_tokens(sync_conn):
+    """Encrypt or mark Apple tokens written before the ciphertext marker"""
+    for table_name, column_names in _ENCRYPTED_TOKEN_COLUMNS.items():
+        table = Base.metadata.tables.get(table_name)
+        if table is None:
+            continue
+        primary_key = table.primary_key.columns.values()[0]
+        for column_name in column_names:
+            column = table.c[column_name]
+            rows = sync_conn.execute(
+                select(primary_key, column).where(
+                    column.is_not(None),
+                    column.not_like(f"{ENCRYPTED_TOKEN_PREFIX}%")
+                )
+            ).all()
+            for key, token in rows:
+                sync_conn.execute(
+                    update(table).where(primary_key == key).values({column_name: _mark_encrypted(token)})
+                )
+
 async def init_db():
     """Initialize database tables"""
     async with engine.begin() as conn:
-        await conn.run_sync(Base.metadata.create_all)
\ No newline at end of file
+        await conn.run_sync(Base.metadata.create_all)
+        await conn.run_sync(_create_missing_indexes)
+        await conn.run_sync(_encrypt_plaintext_tokens)
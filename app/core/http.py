@@ -0,0 +1,14 @@
+import httpx
+from fastapi import Request
+
+def create_http_client() -> httpx.AsyncClient:
+    """Create the application-wide HTTP client for outbound OAuth and Apple Music calls"""
+    return httpx.AsyncClient(
+        timeout=10.0,
+        http2=True,
+        limits=httpx.Limits(max_connections=100, max_keepalive_connections=50, keepalive_expiry=30.0)
+    )
+
+def get_http_client(request: Request) -> httpx.AsyncClient:
+    """Dependency to get the shared HTTP client created at startup"""
+    return request.app.state.http
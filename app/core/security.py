@@ -1,74 +1,120 @@
 import jwt
 import time
-from datetime import datetime, timedelta
+import base64
+import threading
+import orjson
 from pathlib import Path
-from typing import Optional
-from cryptography.fernet import Fernet
+from typing import Optional, Dict, Any
+from cryptography.fernet import Fernet, InvalidToken
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.asymmetric.ec import EllipticCurvePrivateKey
+from cryptography.hazmat.primitives.kdf.hkdf import HKDF
+from cryptography.hazmat.primitives.serialization import load_pem_private_key
 
 from app.core.config import settings
 
+# Developer token cache - the token is valid for 12 hours, so sign it once and
+# reuse it until shortly before it expires
+_DEV_TOKEN: Optional[str] = None
+_DEV_TOKEN_EXP: float = 0
+_PRIVATE_KEY_CACHED: Optional[EllipticCurvePrivateKey] = None
+_DEV_TOKEN_LOCK = threading.Lock()
+
+# Re-sign this many seconds before the cached token actually expires
+DEV_TOKEN_REFRESH_MARGIN = 300
+
 def generate_developer_token() -> str:
-    """Generate Apple Music developer token (JWT)"""
-    
-    # Read private key
-    private_key_path = Path(settings.apple_private_key_path)
-    if not private_key_path.exists():
-        raise FileNotFoundError(f"Private key not found at {settings.apple_private_key_path}")
+    """Generate Apple Music developer token (JWT), reusing the cached one while valid"""
+    global _DEV_TOKEN, _DEV_TOKEN_EXP, _PRIVATE_KEY_CACHED
     
-    with open(private_key_path, 'r') as key_file:
-        private_key = key_file.read()
+    if _DEV_TOKEN and time.time() < _DEV_TOKEN_EXP - DEV_TOKEN_REFRESH_MARGIN:
+        return _DEV_TOKEN
     
-    # Token payload
-    now = datetime.utcnow()
-    payload = {
-        'iss': settings.apple_team_id,
-        'iat': int(now.timestamp()),
-        'exp': int((now + timedelta(hours=12)).timestamp()),  # 12 hour expiry
-        'aud': 'appstoreconnect-v1'
-    }
-    
-    # Generate JWT
-    token = jwt.encode(
-        payload,
-        private_key,
-        algorithm='ES256',
-        headers={'kid': settings.apple_key_id}
-    )
-    
-    return token
+    with _DEV_TOKEN_LOCK:
+        # Another caller may have re-signed while we waited for the lock
+        if _DEV_TOKEN and time.time() < _DEV_TOKEN_EXP - DEV_TOKEN_REFRESH_MARGIN:
+            return _DEV_TOKEN
+        
+        # Read and parse private key once, so signing never re-parses the PEM
+        if _PRIVATE_KEY_CACHED is None:
+            private_key_path = Path(settings.apple_private_key_path)
+            if not private_key_path.exists():
+                raise FileNotFoundError(f"Private key not found at {settings.apple_private_key_path}")
+            
+            with open(private_key_path, 'rb') as key_file:
+                _PRIVATE_KEY_CACHED = load_pem_private_key(key_file.read(), password=None)
+        
+        # Token payload
+        now = int(time.time())
+        exp = now + 12 * 3600  # 12 hour expiry
+        payload = {
+            'iss': settings.apple_team_id,
+            'iat': now,
+            'exp': exp,
+            'aud': 'appstoreconnect-v1'
+        }
+        
+        # Generate JWT
+        token = jwt.encode(
+            payload,
+            _PRIVATE_KEY_CACHED,
+            algorithm='ES256',
+            headers={'kid': settings.apple_key_id}
+        )
+        
+        _DEV_TOKEN = token
+        _DEV_TOKEN_EXP = exp
+        return token
 
-def validate_developer_token(token: str) -> bool:
-    """Validate Apple Music developer token"""
-    try:
-        # For validation, we mainly check if it's not expired
-        decoded = jwt.decode(token, options={"verify_signature": False})
-        exp = decoded.get('exp', 0)
-        return exp > time.time()
-    except:
-        return False
+# Fernet parses the key and sets up its primitives on construction, so build
+# the cipher once at import and share it across all token operations
+_CIPHER = Fernet(settings.token_encryption_key.encode())
+
+# Sealed OAuth state travels through the browser, so it gets its own key derived
+# from the encryption key - token ciphertext can never be replayed as state
+_SEAL_CIPHER = Fernet(base64.urlsafe_b64encode(HKDF(
+    algorithm=hashes.SHA256(),
+    length=32,
+    salt=None,
+    info=b"apple-music-mcp oauth request seal"
+).derive(base64.urlsafe_b64decode(settings.token_encryption_key))))
+
+# Marks stored values as ciphertext, so plaintext rows are never mistaken for it
+ENCRYPTED_TOKEN_PREFIX = "enc:"
 
 class TokenEncryption:
     """Encrypt/decrypt sensitive tokens for database storage"""
     
     def __init__(self):
-        # Use the configured encryption key
-        self.cipher = Fernet(settings.token_encryption_key.encode())
+        # Reuse the shared module-level cipher
+        self.cipher = _CIPHER
     
     def encrypt_token(self, token: str) -> str:
         """Encrypt sensitive token for storage"""
-        return self.cipher.encrypt(token.encode()).decode()
+        return ENCRYPTED_TOKEN_PREFIX + self.cipher.encrypt(token.encode()).decode()
     
     def decrypt_token(self, encrypted_token: str) -> str:
         """Decrypt token for use"""
-        return self.cipher.decrypt(encrypted_token.encode()).decode()
+        return self.cipher.decrypt(encrypted_token.removeprefix(ENCRYPTED_TOKEN_PREFIX).encode()).decode()
 
 # Utility functions for convenience
 def encrypt_token(token: str) -> str:
     """Encrypt a token for database storage"""
-    encryption = TokenEncryption()
-    return encryption.encrypt_token(token)
+    return ENCRYPTED_TOKEN_PREFIX + _CIPHER.encrypt(token.encode()).decode()
 
 def decrypt_token(encrypted_token: str) -> str:
     """Decrypt a token from database storage"""
-    encryption = TokenEncryption()
-    return encryption.decrypt_token(encrypted_token)
\ No newline at end of file
+    # Access tokens issued before the marker carry bare Fernet ciphertext
+    return _CIPHER.decrypt(encrypted_token.removeprefix(ENCRYPTED_TOKEN_PREFIX).encode()).decode()
+
+def seal_payload(data: Dict[str, Any]) -> str:
+    """Encrypt a JSON payload into an opaque, URL-safe, timestamped string"""
+    return _SEAL_CIPHER.encrypt(orjson.dumps(data)).decode()
+
+def unseal_payload(sealed: str, ttl: int) -> Optional[Dict[str, Any]]:
+    """Decrypt a sealed payload, or None if it is invalid or older than ttl seconds"""
+    try:
+        data = orjson.loads(_SEAL_CIPHER.decrypt(sealed, ttl=ttl))
+    except (InvalidToken, TypeError, orjson.JSONDecodeError):
+        return None
+    return data if isinstance(data, dict) else None
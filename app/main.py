@@ -1,25 +1,76 @@
 from fastapi import FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import StreamingResponse, JSONResponse
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import StreamingResponse, ORJSONResponse, Response
 from fastapi.staticfiles import StaticFiles
 from datetime import datetime
 import uvicorn
-import json
+import os
+import time
+import logging
+import orjson
 import asyncio
 from typing import Dict, Any, Optional, Union, AsyncIterator
-from pydantic import BaseModel
-from contextlib import asynccontextmanager
+from pydantic import BaseModel, ValidationError
+from contextlib import asynccontextmanager, suppress
+from sqlalchemy import delete
 
 from app.core.config import settings
-from app.core.database import init_db
+from app.core.database import init_db, engine, AsyncSessionLocal, is_sqlite
+from app.core.http import create_http_client
+from app.models.oauth import AuthorizationCodeGrant
 from app.services.mcp_handler import MCPHandler
 from app.api.endpoints import oauth
 
+logging.basicConfig(
+    level=logging.DEBUG if settings.debug else logging.INFO,
+    format="%(asctime)s %(levelname)s %(name)s: %(message)s"
+)
+# httpx logs every request at INFO, which would add a formatted record per Apple Music call
+if not settings.debug:
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+logger = logging.getLogger(__name__)
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # Initialize database on startup
     await init_db()
+    
+    # Shared HTTP client so outbound calls (OAuth and Apple Music) reuse pooled connections
+    app.state.http = create_http_client()
+    await mcp_handler.startup(app.state.http)
+    
+    # Build the OpenAPI schema up front rather than on the first /openapi.json hit
+    if app.openapi_url:
+        app.openapi()
+    
+    # Periodically purge expired authorization codes
+    gc_task = asyncio.create_task(_gc_loop())
     yield
+    # Let the purge loop finish cancelling before its connections go away
+    gc_task.cancel()
+    with suppress(asyncio.CancelledError):
+        await gc_task
+    await app.state.http.aclose()
+    await engine.dispose()
+
+# How often expired OAuth rows are purged, in seconds
+GC_INTERVAL = 60
+
+async def _gc_loop():
+    """Delete expired authorization codes so lookup indexes stay small"""
+    while True:
+        await asyncio.sleep(GC_INTERVAL)
+        try:
+            async with AsyncSessionLocal() as session:
+                await session.execute(
+                    delete(AuthorizationCodeGrant).where(
+                        AuthorizationCodeGrant.expires_at < datetime.utcnow()
+                    )
+                )
+                await session.commit()
+        except Exception as e:
+            logger.error("Expired grant cleanup failed - %s: %s", type(e).__name__, e)
 
 app = FastAPI(
     title="Apple Music MCP Server",
@@ -27,6 +78,8 @@ app = FastAPI(
     version="1.0.0",
     docs_url="/docs" if settings.debug else None,
     redoc_url="/redoc" if settings.debug else None,
+    openapi_url="/openapi.json" if settings.debug else None,
+    default_response_class=ORJSONResponse,
     lifespan=lifespan
 )
 
@@ -39,6 +92,20 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+class SSEAwareGZipMiddleware(GZipMiddleware):
+    """GZip responses, except SSE streams which must not be buffered by the compressor"""
+    
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http":
+            accept = dict(scope["headers"]).get(b"accept", b"")
+            if b"text/event-stream" in accept:
+                await self.app(scope, receive, send)
+                return
+        await super().__call__(scope, receive, send)
+
+# Compress large tool-call payloads
+app.add_middleware(SSEAwareGZipMiddleware, minimum_size=1024)
+
 # Include OAuth router
 app.include_router(oauth.router)
 
@@ -48,6 +115,9 @@ app.mount("/static", StaticFiles(directory="app/static"), name="static")
 # Initialize MCP handler
 mcp_handler = MCPHandler()
 
+# Tool results are read by MCP clients, not humans - only pretty-print when debugging
+_TOOL_RESULT_OPTS = orjson.OPT_INDENT_2 if settings.debug else 0
+
 # Pydantic models for MCP requests
 class MCPRequest(BaseModel):
     jsonrpc: str = "2.0"
@@ -63,58 +133,55 @@ class ToolCallRequest(BaseModel):
 async def root():
     return {"message": "Apple Music MCP Server", "version": "1.0.0"}
 
-@app.post("/mcp")
 @app.get("/mcp")
-async def mcp_endpoint(request: Request, mcp_request: Optional[MCPRequest] = None):
+async def mcp_info(request: Request):
     """
-    Streamable HTTP MCP endpoint
-    Handles both GET (for SSE upgrade) and POST (for JSON-RPC) requests
+    Streamable HTTP MCP endpoint (GET)
+    Upgrades to SSE when requested, otherwise returns server info
     """
-    if request.method == "GET":
-        # Check if client wants SSE streaming
-        accept_header = request.headers.get("accept", "")
-        if "text/event-stream" in accept_header:
-            return StreamingResponse(
-                mcp_event_stream(),
-                media_type="text/event-stream",
-                headers={
-                    "Cache-Control": "no-cache",
-                    "Connection": "keep-alive",
-                    "Access-Control-Allow-Origin": "*",
-                    "Access-Control-Allow-Headers": "*",
-                    "Access-Control-Allow-Methods": "*",
-                }
-            )
-        else:
-            # Return server info for regular GET requests
-            return {
-                "name": "Apple Music MCP Server",
-                "version": "1.0.0",
-                "protocol": "mcp",
-                "capabilities": {
-                    "tools": True,
-                    "resources": False,
-                    "prompts": False,
-                    "logging": False
-                }
+    # Check if client wants SSE streaming
+    accept_header = request.headers.get("accept", "")
+    if "text/event-stream" in accept_header:
+        return StreamingResponse(
+            mcp_event_stream(),
+            media_type="text/event-stream",
+            headers={
+                "Cache-Control": "no-cache",
+                "Connection": "keep-alive",
+                "Access-Control-Allow-Origin": "*",
+                "Access-Control-Allow-Headers": "*",
+                "Access-Control-Allow-Methods": "*",
             }
+        )
     
-    elif request.method == "POST":
-        # Handle JSON-RPC MCP requests
-        if not mcp_request:
-            # Try to parse from raw body if pydantic didn't catch it
-            body = await request.body()
-            try:
-                data = json.loads(body.decode())
-                mcp_request = MCPRequest(**data)
-            except:
-                raise HTTPException(status_code=400, detail="Invalid JSON-RPC request")
-        
-        # Extract authorization header for tool calls
-        authorization_header = request.headers.get("authorization")
-        return await handle_mcp_request(mcp_request, authorization_header)
+    # Return server info for regular GET requests
+    return {
+        "name": "Apple Music MCP Server",
+        "version": "1.0.0",
+        "protocol": "mcp",
+        "capabilities": {
+            "tools": True,
+            "resources": False,
+            "prompts": False,
+            "logging": False
+        }
+    }
+
+@app.post("/mcp")
+async def mcp_endpoint(request: Request):
+    """
+    Streamable HTTP MCP endpoint (POST)
+    Handles JSON-RPC requests; the authorization header is passed through for tool calls
+    """
+    # Validate straight from the raw bytes - skips FastAPI's json.loads + dict validation pass
+    try:
+        mcp_request = MCPRequest.model_validate_json(await request.body())
+    except ValidationError:
+        raise HTTPException(status_code=400, detail="Invalid JSON-RPC request")
+    
+    return await handle_mcp_request(mcp_request, request.headers.get("authorization"))
 
-async def handle_mcp_request(mcp_request: MCPRequest, authorization_header: Optional[str] = None) -> Dict[str, Any]:
+async def handle_mcp_request(mcp_request: MCPRequest, authorization_header: Optional[str] = None) -> Union[Dict[str, Any], Response]:
     """Handle MCP JSON-RPC requests"""
     try:
         if mcp_request.method == "initialize":
@@ -137,12 +204,12 @@ async def handle_mcp_request(mcp_request: MCPRequest, authorization_header: Opti
             }
         
         elif mcp_request.method == "tools/list":
-            tools = await mcp_handler.get_tools()
-            return {
-                "jsonrpc": "2.0",
-                "id": mcp_request.id,
-                "result": {"tools": tools}
-            }
+            # Splice the request id into the pre-serialized tools list instead of re-encoding it
+            return Response(
+                content=b'{"jsonrpc":"2.0","id":' + orjson.dumps(mcp_request.id)
+                + b',"result":{"tools":' + mcp_handler.get_tools_json() + b'}}',
+                media_type="application/json"
+            )
         
         elif mcp_request.method == "tools/call":
             if not mcp_request.params:
@@ -154,17 +221,11 @@ async def handle_mcp_request(mcp_request: MCPRequest, authorization_header: Opti
             if not tool_name:
                 raise ValueError("Missing tool name")
             
-            print(f"DEBUG: Calling tool '{tool_name}' with arguments: {arguments}")
+            logger.debug("Calling tool '%s' with arguments: %s", tool_name, arguments)
             
-            try:
-                # Pass authorization header for user token extraction
-                result = await mcp_handler.handle_tool_call(tool_name, arguments, authorization_header)
-                print(f"DEBUG: Tool call successful, result type: {type(result)}")
-            except Exception as e:
-                print(f"ERROR: Tool call failed - {type(e).__name__}: {e}")
-                import traceback
-                print(f"ERROR: Full traceback:\n{traceback.format_exc()}")
-                raise
+            # Pass authorization header for user token extraction (failures are logged by the handler)
+            result = await mcp_handler.handle_tool_call(tool_name, arguments, authorization_header)
+            logger.debug("Tool call successful, result type: %s", type(result))
             
             return {
                 "jsonrpc": "2.0",
@@ -173,7 +234,7 @@ async def handle_mcp_request(mcp_request: MCPRequest, authorization_header: Opti
                     "content": [
                         {
                             "type": "text",
-                            "text": json.dumps(result, indent=2)
+                            "text": orjson.dumps(result, option=_TOOL_RESULT_OPTS).decode()
                         }
                     ]
                 }
@@ -199,32 +260,33 @@ async def handle_mcp_request(mcp_request: MCPRequest, authorization_header: Opti
             }
         }
 
-async def mcp_event_stream() -> AsyncIterator[str]:
+# SSE frames are constant, so encode them once. Heartbeats are SSE comments,
+# which clients ignore apart from keeping the connection open
+_SSE_CONNECTED = b"data: " + orjson.dumps({"type": "connection", "status": "connected"}) + b"\n\n"
+_SSE_HEARTBEAT = b": keepalive\n\n"
+SSE_HEARTBEAT_INTERVAL = 30
+
+async def mcp_event_stream() -> AsyncIterator[bytes]:
     """Generate MCP event stream for SSE connections"""
     try:
         # Send initial connection acknowledgment
-        yield f"data: {json.dumps({'type': 'connection', 'status': 'connected'})}\n\n"
+        yield _SSE_CONNECTED
         
-        # Keep connection alive with periodic heartbeats
+        # Keep connection alive with periodic heartbeats; cancellation on
+        # client disconnect propagates out of the sleep
         while True:
-            heartbeat = {
-                "type": "heartbeat",
-                "timestamp": datetime.utcnow().isoformat()
-            }
-            yield f"data: {json.dumps(heartbeat)}\n\n"
-            await asyncio.sleep(30)
+            await asyncio.sleep(SSE_HEARTBEAT_INTERVAL)
+            yield _SSE_HEARTBEAT
             
-    except asyncio.CancelledError:
-        pass
     except Exception as e:
         error_msg = {"type": "error", "message": str(e)}
-        yield f"data: {json.dumps(error_msg)}\n\n"
+        yield b"data: " + orjson.dumps(error_msg) + b"\n\n"
 
 @app.get("/health")
 async def health_check():
     return {
         "status": "healthy",
-        "timestamp": datetime.utcnow().isoformat(),
+        "timestamp": time.time(),
         "version": "1.0.0",
         "services": {
             "server": "online"
@@ -232,20 +294,23 @@ async def health_check():
     }
 
 # MCP Protocol Endpoints
+_TOOLS_RESPONSE = b'{"tools":' + mcp_handler.get_tools_json() + b'}'
+
 @app.get("/mcp/tools")
 async def get_tools():
     """Get available MCP tools"""
-    try:
-        tools = await mcp_handler.get_tools()
-        return {"tools": tools}
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+    return Response(content=_TOOLS_RESPONSE, media_type="application/json")
 
 @app.post("/mcp/call-tool")
-async def call_tool(request: ToolCallRequest):
+async def call_tool(request: Request):
     """Call an MCP tool"""
     try:
-        result = await mcp_handler.handle_tool_call(request.name, request.arguments)
+        tool_call = ToolCallRequest.model_validate_json(await request.body())
+    except ValidationError:
+        raise HTTPException(status_code=400, detail="Invalid tool call request")
+    
+    try:
+        result = await mcp_handler.handle_tool_call(tool_call.name, tool_call.arguments)
         return {"result": result}
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
@@ -257,5 +322,10 @@ if __name__ == "__main__":
         "app.main:app",
         host=settings.server_host,
         port=settings.server_port,
+        loop="uvloop",
+        http="httptools",
+        # Reload mode only supports a single worker. Caches are per process and SQLite
+        # serializes writers, so SQLite also defaults to one
+        workers=1 if settings.debug else (settings.server_workers or (1 if is_sqlite else os.cpu_count())),
         reload=settings.debug,
     )
\ No newline at end of file
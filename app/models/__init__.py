@@ -1,3 +1,3 @@
-from .oauth import OAuth2Client, AuthorizationRequest, AuthorizationCodeGrant, AccessToken
+from .oauth import OAuth2Client, AuthorizationCodeGrant, AccessToken
 
-__all__ = ["OAuth2Client", "AuthorizationRequest", "AuthorizationCodeGrant", "AccessToken"]
\ No newline at end of file
+__all__ = ["OAuth2Client", "AuthorizationCodeGrant", "AccessToken"]
\ No newline at end of file
@@ -1,52 +1,95 @@
 import httpx
+import orjson
+from contextvars import ContextVar
 from typing import Dict, List, Optional, Any
 import asyncio
+import logging
+import random
 from datetime import datetime, timedelta
 
+from app.core.cache import catalog_cache, get_or_fetch
 from app.core.config import settings
-from app.core.security import generate_developer_token, validate_developer_token
+from app.core.security import generate_developer_token, DEV_TOKEN_REFRESH_MARGIN
+
+logger = logging.getLogger(__name__)
+
+# MusicKit user token for the current request. A context variable keeps concurrent
+# tool calls isolated while they share one client (child tasks inherit the value)
+current_user_token: ContextVar[Optional[str]] = ContextVar("apple_music_user_token", default=None)
+
+def _resource_refs(ids: List[Any], resource_type: str) -> List[Dict[str, str]]:
+    """Build the [{"id": ..., "type": ...}] payload list Apple Music write endpoints expect"""
+    return [{"id": str(resource_id), "type": resource_type} for resource_id in ids]
 
 class AppleMusicClient:
     """Apple Music API client with authentication and rate limiting"""
     
     BASE_URL = "https://api.music.apple.com/v1"
+    REQUEST_TIMEOUT = 30.0
+    PAGE_CONCURRENCY = 4
+    WRITE_CONCURRENCY = 5
+    TRACK_BATCH_SIZE = 100  # Apple Music accepts at most 100 tracks per request
+    SEARCH_CONCURRENCY = 8
     
-    def __init__(self):
+    # Retry policy - 429s are retried for any method, 5xx/transport errors only when idempotent.
+    # DELETE is left out: playlist track deletes are by index, so replaying one that
+    # Apple already applied would remove whatever has shifted into those positions
+    MAX_RETRIES = 5
+    MAX_BACKOFF = 60.0
+    IDEMPOTENT_METHODS = frozenset({"GET", "PUT"})
+    
+    def __init__(self, http_client: Optional[httpx.AsyncClient] = None):
         self.developer_token: Optional[str] = None
         self.token_expires: Optional[datetime] = None
-        self.user_token: Optional[str] = None
-        self.client: Optional[httpx.AsyncClient] = None
+        # A shared client keeps its connection pool warm across instances
+        self.client: Optional[httpx.AsyncClient] = http_client
+        self._owns_client = http_client is None
+        self._headers: Dict[str, str] = {}
     
     async def __aenter__(self):
-        self.client = httpx.AsyncClient(timeout=30.0)
+        if self.client is None:
+            self.client = httpx.AsyncClient(timeout=self.REQUEST_TIMEOUT, http2=True)
         return self
     
     async def __aexit__(self, exc_type, exc_val, exc_tb):
-        if self.client:
+        # Only close clients we created - a shared client outlives this instance
+        if self.client and self._owns_client:
             await self.client.aclose()
             self.client = None
     
-    def _get_headers(self) -> Dict[str, str]:
-        """Get request headers with authentication"""
-        headers = {
+    @property
+    def user_token(self) -> Optional[str]:
+        """MusicKit user token of the current request, if any"""
+        return current_user_token.get()
+    
+    def _rebuild_headers(self):
+        """Rebuild cached request headers - only needed when the developer token changes"""
+        self._headers = {
             "Authorization": f"Bearer {self.developer_token}",
             "Content-Type": "application/json"
         }
-        
-        if self.user_token:
-            headers["Music-User-Token"] = self.user_token
-            
-        return headers
+    
+    def _get_headers(self) -> Dict[str, str]:
+        """Get request headers with authentication"""
+        user_token = current_user_token.get()
+        if user_token:
+            return {**self._headers, "Music-User-Token": user_token}
+        return self._headers
     
     async def ensure_developer_token(self):
         """Ensure we have a valid developer token"""
-        if not self.developer_token or not validate_developer_token(self.developer_token):
-            self.developer_token = generate_developer_token()
-            self.token_expires = datetime.utcnow() + timedelta(hours=12)
+        # The shared token always has at least the refresh margin left when handed out,
+        # so holding it for that long needs no per-request JWT decode
+        if not self.developer_token or datetime.utcnow() >= self.token_expires:
+            developer_token = generate_developer_token()
+            self.token_expires = datetime.utcnow() + timedelta(seconds=DEV_TOKEN_REFRESH_MARGIN)
+            if developer_token != self.developer_token:
+                self.developer_token = developer_token
+                self._rebuild_headers()
     
-    def set_user_token(self, user_token: str):
-        """Set user token for authenticated requests"""
-        self.user_token = user_token
+    def set_user_token(self, user_token: Optional[str]):
+        """Set user token for authenticated requests in the current context"""
+        current_user_token.set(user_token)
     
     async def _make_request(
         self, 
@@ -60,34 +103,67 @@ class AppleMusicClient:
         
         url = f"{self.BASE_URL}{endpoint}"
         headers = self._get_headers()
+        content = orjson.dumps(json_data) if json_data is not None else None
+        idempotent = method in self.IDEMPOTENT_METHODS
         
-        response = await self.client.request(
-            method=method,
-            url=url,
-            headers=headers,
-            params=params,
-            json=json_data
-        )
-        
-        if response.status_code == 429:  # Rate limited
-            retry_after = int(response.headers.get("Retry-After", 60))
-            await asyncio.sleep(retry_after)
-            return await self._make_request(method, endpoint, params, json_data)
+        attempt = 0
+        while True:
+            try:
+                response = await self.client.request(
+                    method=method,
+                    url=url,
+                    headers=headers,
+                    params=params,
+                    content=content,
+                    timeout=self.REQUEST_TIMEOUT
+                )
+            except httpx.TransportError:
+                if not idempotent or attempt >= self.MAX_RETRIES:
+                    raise
+                await asyncio.sleep(self._backoff(attempt))
+                attempt += 1
+                continue
+            
+            if attempt < self.MAX_RETRIES:
+                if response.status_code == 429:  # Rate limited
+                    await asyncio.sleep(self._backoff(attempt, response.headers.get("Retry-After")))
+                    attempt += 1
+                    continue
+                if response.status_code >= 500 and idempotent:
+                    await asyncio.sleep(self._backoff(attempt))
+                    attempt += 1
+                    continue
+            
+            break
         
         response.raise_for_status()
         
         # Handle empty responses
         if response.content:
             try:
-                return response.json()
+                return orjson.loads(response.content)
             except ValueError as e:
-                print(f"DEBUG: Failed to parse JSON response: {e}")
-                print(f"DEBUG: Response content: {response.text}")
+                logger.debug("Failed to parse JSON response: %s", e)
+                logger.debug("Response content: %s", response.text)
                 raise
         else:
             # Return empty dict for successful requests with no content
             return {}
     
+    async def _cached_request(self, key: tuple, endpoint: str, params: Dict[str, Any]) -> Dict[str, Any]:
+        """GET a user-independent catalog resource through the shared TTL cache"""
+        return await get_or_fetch(
+            catalog_cache, key, lambda: self._make_request("GET", endpoint, params=params)
+        )
+    
+    def _backoff(self, attempt: int, retry_after: Optional[str] = None) -> float:
+        """Delay before the next retry - Retry-After if given, else exponential, plus jitter"""
+        try:
+            delay = float(retry_after)
+        except (TypeError, ValueError):
+            delay = 2 ** attempt
+        return min(delay, self.MAX_BACKOFF) + random.uniform(0, 1)
+    
     # Catalog Search (for finding song IDs)
     async def search_catalog(
         self, 
@@ -102,17 +178,18 @@ class AppleMusicClient:
             "types": types,
             "limit": limit
         }
-        return await self._make_request("GET", f"/catalog/{country}/search", params=params)
+        key = ("search", query, types, limit, country)
+        return await self._cached_request(key, f"/catalog/{country}/search", params)
     
     async def search_songs(self, query: str, limit: int = 10, country: str = "US") -> List[Dict[str, Any]]:
         """Search for songs and return simplified track list for LLM usage"""
-        print(f"DEBUG: AppleMusicClient.search_songs called with query='{query}', limit={limit}")
+        logger.debug("AppleMusicClient.search_songs called with query='%s', limit=%s", query, limit)
         
         try:
             search_results = await self.search_catalog(query, types="songs", limit=limit, country=country)
-            print(f"DEBUG: search_catalog returned: {type(search_results)}")
+            logger.debug("search_catalog returned: %s", type(search_results))
         except Exception as e:
-            print(f"ERROR: search_catalog failed - {type(e).__name__}: {e}")
+            logger.error("search_catalog failed - %s: %s", type(e).__name__, e)
             raise
         
         songs = search_results.get("results", {}).get("songs", {}).get("data", [])
@@ -197,69 +274,107 @@ class AppleMusicClient:
             }
         }
         
-        if track_ids:
+        # The first batch of tracks rides along with the create request itself
+        track_ids = track_ids or []
+        inline_ids = track_ids[:self.TRACK_BATCH_SIZE]
+        overflow_ids = track_ids[self.TRACK_BATCH_SIZE:]
+        if inline_ids:
             json_data["relationships"] = {
                 "tracks": {
-                    "data": [{"id": track_id, "type": "library-songs"} for track_id in track_ids]
+                    "data": _resource_refs(inline_ids, "library-songs")
                 }
             }
         
-        return await self._make_request("POST", "/me/library/playlists", json_data=json_data)
+        result = await self._make_request("POST", "/me/library/playlists", json_data=json_data)
+        
+        # Anything over the per-request cap is appended afterwards, batch by batch in order
+        if overflow_ids:
+            playlist_id = result["data"][0]["id"]
+            await self.add_tracks_to_playlist(playlist_id, _resource_refs(overflow_ids, "library-songs"))
+        
+        return result
     
     async def add_to_library(self, song_ids: List[str]) -> Dict[str, Any]:
         """Add songs to library by catalog IDs"""
         json_data = {
-            "data": [{"id": song_id, "type": "songs"} for song_id in song_ids]
+            "data": _resource_refs(song_ids, "songs")
         }
         return await self._make_request("POST", "/me/library", json_data=json_data)
     
     # Batch Operations Methods
     async def get_playlist_tracks(self, playlist_id: str, limit: int = 300) -> List[Dict[str, Any]]:
         """Get all tracks from a playlist with pagination"""
-        all_tracks = []
-        offset = 0
+        endpoint = f"/me/library/playlists/{playlist_id}/tracks"
         
         try:
-            while True:
-                response = await self._make_request(
-                    "GET", 
-                    f"/me/library/playlists/{playlist_id}/tracks",
-                    params={"limit": limit, "offset": offset}
-                )
-                
-                tracks = response.get("data", [])
-                all_tracks.extend(tracks)
-                
-                # Check for next page
-                if not response.get("next") or len(tracks) < limit:
-                    break
-                offset += limit
+            response = await self._make_request("GET", endpoint, params={"limit": limit, "offset": 0})
         except Exception as e:
             # If playlist is empty or newly created, return empty list
-            print(f"DEBUG: get_playlist_tracks failed for {playlist_id}: {e}")
+            logger.debug("get_playlist_tracks failed for %s: %s", playlist_id, e)
             return []
         
+        tracks = response.get("data", [])
+        all_tracks = list(tracks)
+        
+        # Single page playlist
+        if not response.get("next") or len(tracks) < limit:
+            return all_tracks
+        
+        # Past the first page a failure propagates - a partial track list must never
+        # pass for the whole playlist
+        total = response.get("meta", {}).get("total")
+        if total is not None:
+            # Total is known - fetch the remaining pages concurrently (bounded, so very
+            # long playlists don't trigger 429s), preserving order. The task group
+            # cancels the pending pages as soon as one fails
+            semaphore = asyncio.Semaphore(self.PAGE_CONCURRENCY)
+            
+            async def fetch_page(offset: int) -> Dict[str, Any]:
+                async with semaphore:
+                    return await self._make_request("GET", endpoint, params={"limit": limit, "offset": offset})
+            
+            try:
+                async with asyncio.TaskGroup() as task_group:
+                    page_tasks = [
+                        task_group.create_task(fetch_page(offset)) for offset in range(limit, total, limit)
+                    ]
+            except ExceptionGroup as group:
+                raise group.exceptions[0] from group
+            
+            for task in page_tasks:
+                all_tracks.extend(task.result().get("data", []))
+            return all_tracks
+        
+        # No total in the response - walk the pages serially
+        offset = limit
+        while True:
+            response = await self._make_request("GET", endpoint, params={"limit": limit, "offset": offset})
+            
+            tracks = response.get("data", [])
+            all_tracks.extend(tracks)
+            
+            # Check for next page
+            if not response.get("next") or len(tracks) < limit:
+                break
+            offset += limit
+        
         return all_tracks
 
     async def add_tracks_to_playlist(self, playlist_id: str, track_data: List[Dict[str, str]]) -> Dict[str, Any]:
         """Add tracks to playlist. track_data should have 'id' and 'type' for each track"""
-        # Apple Music API limits to 100 tracks per request
-        for i in range(0, len(track_data), 100):
-            batch = track_data[i:i+100]
-            json_data = {"data": batch}
-            
-            await self._make_request(
-                "POST",
-                f"/me/library/playlists/{playlist_id}/tracks",
-                json_data=json_data
-            )
+        # Apple Music API limits to 100 tracks per request. Apple appends each batch as it
+        # lands, so batches go out one at a time to keep the caller's track order
+        endpoint = f"/me/library/playlists/{playlist_id}/tracks"
+        batch_size = self.TRACK_BATCH_SIZE
+        for i in range(0, len(track_data), batch_size):
+            await self._make_request("POST", endpoint, json_data={"data": track_data[i:i+batch_size]})
         
         return {"added": len(track_data)}
 
     async def delete_playlist_tracks(self, playlist_id: str, track_indices: List[int]) -> Dict[str, Any]:
         """Delete tracks from playlist by their indices"""
         # Apple Music uses track indices for deletion
-        json_data = {"data": [{"id": str(idx), "type": "library-playlist-tracks"} for idx in track_indices]}
+        json_data = {"data": _resource_refs(track_indices, "library-playlist-tracks")}
         
         return await self._make_request(
             "DELETE",
@@ -277,14 +392,27 @@ class AppleMusicClient:
             json_data=json_data
         )
 
-    async def parallel_search(self, queries: List[str], search_type: str, types: str, limit: int) -> List[Dict[str, Any]]:
-        """Execute multiple searches in parallel"""
-        if search_type == "catalog":
-            search_tasks = [self.search_catalog(q, types=types, limit=limit) for q in queries]
-        else:  # library
-            search_tasks = [self.search_library(q, types=f"library-{types}", limit=limit) for q in queries]
+    async def parallel_search(
+        self,
+        queries: List[str],
+        search_type: str,
+        types: str,
+        limit: int,
+        semaphore: Optional[asyncio.Semaphore] = None
+    ) -> List[Dict[str, Any]]:
+        """Execute multiple searches in parallel, bounded so large batches don't trigger 429s"""
+        # The bound is per tool call (callers running several batches can share one), so a
+        # large batch from one user never queues other users' searches behind it
+        semaphore = semaphore or asyncio.Semaphore(self.SEARCH_CONCURRENCY)
+        
+        async def bounded_search(query: str) -> Dict[str, Any]:
+            async with semaphore:
+                if search_type == "catalog":
+                    return await self.search_catalog(query, types=types, limit=limit)
+                # library
+                return await self.search_library(query, types=f"library-{types}", limit=limit)
         
-        results = await asyncio.gather(*search_tasks, return_exceptions=True)
+        results = await asyncio.gather(*[bounded_search(q) for q in queries], return_exceptions=True)
         return results
 
     async def get_artist_top_songs(self, artist_id: str, limit: int = 20) -> List[Dict[str, Any]]:
@@ -304,4 +432,5 @@ class AppleMusicClient:
         if genre:
             params["genre"] = genre
         
-        return await self._make_request("GET", "/catalog/us/charts", params=params)
\ No newline at end of file
+        key = ("charts", types, genre, limit)
+        return await self._cached_request(key, "/catalog/us/charts", params)
\ No newline at end of file
@@ -1,312 +1,467 @@
-from typing import Dict, List, Any, Optional, Union
+from typing import Callable, Dict, List, Any, Mapping, Optional, Tuple, Union
+from types import MappingProxyType
+from difflib import SequenceMatcher
+from operator import itemgetter
+import logging
+import time
 import jwt
+import httpx
+import orjson
 import asyncio
-from app.services.apple_music import AppleMusicClient
+from pydantic import ValidationError
+from cryptography.fernet import InvalidToken
+from app.services.apple_music import AppleMusicClient, current_user_token
+from app.services.tool_args import (
+    NoArgs, SearchSongsArgs, GetRecentlyPlayedArgs, SearchLibraryArgs, RateSongArgs,
+    CreatePlaylistArgs, AddToLibraryArgs, BatchAddToPlaylistArgs,
+    BulkPlaylistOperationsArgs, EfficientLibrarySearchArgs
+)
+from app.core.cache import (
+    access_token_cache, empty_search_cache, get_or_fetch, library_stats_cache,
+    playlist_index_cache, song_search_cache, user_cache_key
+)
 from app.core.config import settings
 from app.core.security import decrypt_token
 
-class MCPHandler:
-    """Handle MCP protocol requests and route to Apple Music API"""
+logger = logging.getLogger(__name__)
+
+# Access token decoder and key, set up once instead of on every tool call
+_JWT = jwt.PyJWT(options={"require": ["exp", "apple_user_token"]})
+_JWT_KEY = settings.jwt_secret_key.encode()
+_JWT_ALGORITHMS = ("HS256",)
+
+# Even the smallest signed JWT is longer than this, so shorter bearer values skip verification
+_MIN_JWT_LENGTH = 40
+
+# Upstream statuses that doom every operation in a bulk request alike (revoked or
+# missing user token), so they abort the batch rather than being reported per operation
+_FATAL_STATUS_CODES = frozenset({401, 403})
+
+def _song_query(song_info: Dict[str, Any]) -> Optional[str]:
+    """Build an "artist title" catalog search term from a song description"""
+    return " ".join(filter(None, (song_info.get("artist"), song_info.get("title")))) or None
+
+# Shared read-only stand-in for missing nested objects in per-item lookups, so a miss
+# doesn't allocate a fresh empty dict
+_EMPTY: Mapping[str, Any] = MappingProxyType({})
+
+def _catalog_id(track: Dict[str, Any]) -> Optional[str]:
+    """Catalog ID of a library track, without allocating empty defaults on misses"""
+    attributes = track.get("attributes")
+    play_params = attributes.get("playParams") if attributes else None
+    return play_params.get("catalogId") if play_params else None
+
+def _item_extractor(return_format: str, type_name: str) -> Callable[[Dict[str, Any]], Any]:
+    """Per-item transform for efficient_library_search results in the requested format"""
+    if return_format == "ids_only":
+        return itemgetter("id")
+    if return_format == "full":
+        return lambda item: item
     
-    def __init__(self):
-        self.apple_client = AppleMusicClient()
+    # minimal: ID, name, and key attributes, plus song-specific ones for songs
+    if type_name == "songs":
+        def minimal_song(item: Dict[str, Any]) -> Dict[str, Any]:
+            attrs = item.get("attributes") or _EMPTY
+            return {
+                "id": item["id"],
+                "name": attrs.get("name"),
+                "type": type_name,
+                "artist": attrs.get("artistName"),
+                "catalog_id": _catalog_id(item),
+                "isrc": attrs.get("isrc")
+            }
+        return minimal_song
     
-    def _extract_user_token(self, authorization_header: Optional[str]) -> Optional[str]:
-        """Extract MusicKit user token from OAuth Bearer token"""
-        if not authorization_header or not authorization_header.startswith("Bearer "):
-            return None
-        
-        try:
-            access_token = authorization_header[7:]  # Remove "Bearer " prefix
-            payload = jwt.decode(
-                access_token, 
-                settings.jwt_secret_key, 
-                algorithms=["HS256"]
-            )
-            
-            encrypted_user_token = payload.get("apple_user_token")
-            if encrypted_user_token:
-                return decrypt_token(encrypted_user_token)
-            
-        except (jwt.InvalidTokenError, Exception) as e:
-            print(f"DEBUG: Failed to extract user token: {e}")
-        
-        return None
+    def minimal_item(item: Dict[str, Any]) -> Dict[str, Any]:
+        return {
+            "id": item["id"],
+            "name": (item.get("attributes") or _EMPTY).get("name"),
+            "type": type_name
+        }
+    return minimal_item
+
+def _best_match(query: str, candidates: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Pick the search result whose "artist title" reads closest to the query; ties keep search order"""
+    if len(candidates) == 1:
+        return candidates[0]
     
-    async def get_tools(self) -> List[Dict[str, Any]]:
-        """Return available MCP tools"""
-        return [
-            {
-                "name": "search_songs",
-                "description": "Search Apple Music catalog for songs",
-                "inputSchema": {
-                    "type": "object",
-                    "properties": {
-                        "query": {"type": "string", "description": "Search query (artist, song title, etc.)"},
-                        "limit": {"type": "number", "default": 10, "description": "Number of results to return"}
-                    },
-                    "required": ["query"]
-                }
-            },
-            {
-                "name": "get_library_stats",
-                "description": "Get statistics about the user's music library",
-                "inputSchema": {
-                    "type": "object",
-                    "properties": {}
-                }
-            },
-            {
-                "name": "get_recently_played", 
-                "description": "Get recently played tracks",
-                "inputSchema": {
-                    "type": "object",
-                    "properties": {
-                        "limit": {"type": "number", "default": 10}
-                    }
-                }
-            },
-            {
-                "name": "search_library",
-                "description": "Search the user's music library",
-                "inputSchema": {
-                    "type": "object", 
-                    "properties": {
-                        "query": {"type": "string"},
-                        "types": {"type": "string", "default": "library-songs"},
-                        "limit": {"type": "number", "default": 25}
-                    },
-                    "required": ["query"]
-                }
+    # SequenceMatcher caches its analysis of the second sequence, so set the query there once
+    matcher = SequenceMatcher(autojunk=False)
+    matcher.set_seq2(query.casefold())
+    
+    def score(candidate: Dict[str, Any]) -> float:
+        attrs = candidate.get("attributes") or _EMPTY
+        matcher.set_seq1(f"{attrs.get('artistName', '')} {attrs.get('name', '')}".casefold())
+        return matcher.ratio()
+    
+    return max(candidates, key=score)
+
+# Tool definitions are static, so build them once at import
+_TOOLS: Tuple[Dict[str, Any], ...] = (
+    {
+        "name": "search_songs",
+        "description": "Search Apple Music catalog for songs",
+        "inputSchema": {
+            "type": "object",
+            "properties": {
+                "query": {"type": "string", "description": "Search query (artist, song title, etc.)"},
+                "limit": {"type": "number", "default": 10, "description": "Number of results to return"}
             },
-            {
-                "name": "rate_song",
-                "description": "Rate a song from 1-5 stars", 
-                "inputSchema": {
-                    "type": "object",
-                    "properties": {
-                        "song_id": {"type": "string", "description": "Apple Music song ID"},
-                        "rating": {"type": "number", "minimum": 1, "maximum": 5}
-                    },
-                    "required": ["song_id", "rating"]
-                }
+            "required": ["query"]
+        }
+    },
+    {
+        "name": "get_library_stats",
+        "description": "Get statistics about the user's music library",
+        "inputSchema": {
+            "type": "object",
+            "properties": {}
+        }
+    },
+    {
+        "name": "get_recently_played", 
+        "description": "Get recently played tracks",
+        "inputSchema": {
+            "type": "object",
+            "properties": {
+                "limit": {"type": "number", "default": 10}
+            }
+        }
+    },
+    {
+        "name": "search_library",
+        "description": "Search the user's music library",
+        "inputSchema": {
+            "type": "object", 
+            "properties": {
+                "query": {"type": "string"},
+                "types": {"type": "string", "default": "library-songs"},
+                "limit": {"type": "number", "default": 25}
             },
-            {
-                "name": "create_playlist",
-                "description": "Create a new playlist",
-                "inputSchema": {
-                    "type": "object",
-                    "properties": {
-                        "name": {"type": "string"},
-                        "description": {"type": "string"},
-                        "track_ids": {"type": "array", "items": {"type": "string"}}
-                    },
-                    "required": ["name"]
-                }
+            "required": ["query"]
+        }
+    },
+    {
+        "name": "rate_song",
+        "description": "Rate a song from 1-5 stars", 
+        "inputSchema": {
+            "type": "object",
+            "properties": {
+                "song_id": {"type": "string", "description": "Apple Music song ID"},
+                "rating": {"type": "number", "minimum": 1, "maximum": 5}
             },
-            {
-                "name": "add_to_library",
-                "description": "Add songs to library",
-                "inputSchema": {
-                    "type": "object",
-                    "properties": {
-                        "song_ids": {"type": "array", "items": {"type": "string"}}
-                    },
-                    "required": ["song_ids"]
-                }
+            "required": ["song_id", "rating"]
+        }
+    },
+    {
+        "name": "create_playlist",
+        "description": "Create a new playlist",
+        "inputSchema": {
+            "type": "object",
+            "properties": {
+                "name": {"type": "string"},
+                "description": {"type": "string"},
+                "track_ids": {"type": "array", "items": {"type": "string"}}
             },
-            {
-                "name": "batch_add_to_playlist",
-                "description": "Add multiple songs to a playlist in a single operation. Accepts song names, IDs, or a mix. Automatically searches for songs if names provided.",
-                "inputSchema": {
-                    "type": "object",
-                    "properties": {
-                        "playlist_identifier": {
-                            "type": "string",
-                            "description": "Playlist name or ID. If name provided, will search user's playlists"
-                        },
-                        "songs": {
-                            "type": "array",
-                            "description": "List of songs to add. Each item can be a song ID, or an object with title/artist",
-                            "items": {
-                                "oneOf": [
-                                    {"type": "string"},
-                                    {
-                                        "type": "object",
-                                        "properties": {
-                                            "title": {"type": "string"},
-                                            "artist": {"type": "string"},
-                                            "album": {"type": "string"}
-                                        }
-                                    }
-                                ]
-                            }
-                        },
-                        "create_if_missing": {
-                            "type": "boolean",
-                            "description": "Create playlist if it doesn't exist",
-                            "default": False
-                        },
-                        "deduplicate": {
-                            "type": "boolean", 
-                            "description": "Skip songs already in playlist",
-                            "default": True
-                        }
-                    },
-                    "required": ["playlist_identifier", "songs"]
-                }
+            "required": ["name"]
+        }
+    },
+    {
+        "name": "add_to_library",
+        "description": "Add songs to library",
+        "inputSchema": {
+            "type": "object",
+            "properties": {
+                "song_ids": {"type": "array", "items": {"type": "string"}}
             },
-            {
-                "name": "bulk_playlist_operations",
-                "description": "Create playlists with initial songs or perform bulk operations on existing playlists",
-                "inputSchema": {
-                    "type": "object",
-                    "properties": {
-                        "operations": {
-                            "type": "array",
-                            "description": "List of playlist operations to perform",
-                            "items": {
+            "required": ["song_ids"]
+        }
+    },
+    {
+        "name": "batch_add_to_playlist",
+        "description": "Add multiple songs to a playlist in a single operation. Accepts song names, IDs, or a mix. Automatically searches for songs if names provided.",
+        "inputSchema": {
+            "type": "object",
+            "properties": {
+                "playlist_identifier": {
+                    "type": "string",
+                    "description": "Playlist name or ID. If name provided, will search user's playlists"
+                },
+                "songs": {
+                    "type": "array",
+                    "description": "List of songs to add. Each item can be a song ID, or an object with title/artist",
+                    "items": {
+                        "oneOf": [
+                            {"type": "string"},
+                            {
                                 "type": "object",
                                 "properties": {
-                                    "operation": {
-                                        "type": "string",
-                                        "enum": ["create", "merge", "duplicate", "clear", "reorder"]
-                                    },
-                                    "playlist_name": {"type": "string"},
-                                    "songs": {
-                                        "type": "array",
-                                        "description": "Songs for create/merge operations"
-                                    },
-                                    "source_playlists": {
-                                        "type": "array",
-                                        "description": "Source playlists for merge operations"
-                                    },
-                                    "order_by": {
-                                        "type": "string",
-                                        "enum": ["title", "artist", "date_added"],
-                                        "description": "For reorder operations"
-                                    }
+                                    "title": {"type": "string"},
+                                    "artist": {"type": "string"},
+                                    "album": {"type": "string"}
                                 }
                             }
-                        },
-                        "batch_mode": {
-                            "type": "string",
-                            "enum": ["sequential", "parallel"],
-                            "default": "parallel"
-                        }
-                    },
-                    "required": ["operations"]
+                        ]
+                    }
+                },
+                "create_if_missing": {
+                    "type": "boolean",
+                    "description": "Create playlist if it doesn't exist",
+                    "default": False
+                },
+                "deduplicate": {
+                    "type": "boolean", 
+                    "description": "Skip songs already in playlist",
+                    "default": True
                 }
             },
-            {
-                "name": "efficient_library_search",
-                "description": "Search user's library and Apple Music catalog efficiently, returning IDs optimized for other tools",
-                "inputSchema": {
-                    "type": "object",
-                    "properties": {
-                        "queries": {
-                            "type": "array",
-                            "description": "Multiple search queries to process",
-                            "items": {"type": "string"}
-                        },
-                        "search_scope": {
-                            "type": "array",
-                            "items": {
+            "required": ["playlist_identifier", "songs"]
+        }
+    },
+    {
+        "name": "bulk_playlist_operations",
+        "description": "Create playlists with initial songs or perform bulk operations on existing playlists",
+        "inputSchema": {
+            "type": "object",
+            "properties": {
+                "operations": {
+                    "type": "array",
+                    "description": "List of playlist operations to perform",
+                    "items": {
+                        "type": "object",
+                        "properties": {
+                            "operation": {
                                 "type": "string",
-                                "enum": ["library", "catalog", "both"]
+                                "enum": ["create", "merge", "duplicate", "clear", "reorder"]
                             },
-                            "default": ["both"]
-                        },
-                        "types": {
-                            "type": "array",
-                            "items": {
-                                "type": "string",
-                                "enum": ["songs", "albums", "artists", "playlists"]
+                            "playlist_name": {"type": "string"},
+                            "songs": {
+                                "type": "array",
+                                "description": "Songs for create/merge operations"
                             },
-                            "default": ["songs"]
-                        },
-                        "return_format": {
-                            "type": "string",
-                            "enum": ["ids_only", "minimal", "full"],
-                            "description": "Control response verbosity",
-                            "default": "minimal"
-                        },
-                        "limit_per_query": {
-                            "type": "integer",
-                            "default": 10
+                            "source_playlists": {
+                                "type": "array",
+                                "description": "Source playlists for merge operations"
+                            },
+                            "order_by": {
+                                "type": "string",
+                                "enum": ["title", "artist", "date_added"],
+                                "description": "For reorder operations"
+                            }
                         }
+                    }
+                },
+                "batch_mode": {
+                    "type": "string",
+                    "enum": ["sequential", "parallel"],
+                    "default": "parallel"
+                }
+            },
+            "required": ["operations"]
+        }
+    },
+    {
+        "name": "efficient_library_search",
+        "description": "Search user's library and Apple Music catalog efficiently, returning IDs optimized for other tools",
+        "inputSchema": {
+            "type": "object",
+            "properties": {
+                "queries": {
+                    "type": "array",
+                    "description": "Multiple search queries to process",
+                    "items": {"type": "string"}
+                },
+                "search_scope": {
+                    "type": "array",
+                    "items": {
+                        "type": "string",
+                        "enum": ["library", "catalog", "both"]
                     },
-                    "required": ["queries"]
+                    "default": ["both"]
+                },
+                "types": {
+                    "type": "array",
+                    "items": {
+                        "type": "string",
+                        "enum": ["songs", "albums", "artists", "playlists"]
+                    },
+                    "default": ["songs"]
+                },
+                "return_format": {
+                    "type": "string",
+                    "enum": ["ids_only", "minimal", "full"],
+                    "description": "Control response verbosity",
+                    "default": "minimal"
+                },
+                "limit_per_query": {
+                    "type": "integer",
+                    "default": 10
                 }
-            }
-        ]
+            },
+            "required": ["queries"]
+        }
+    }
+)
+
+# Serialized once - the tools list is the same for every client
+_TOOLS_JSON: bytes = orjson.dumps(_TOOLS)
+
+class MCPHandler:
+    """Handle MCP protocol requests and route to Apple Music API"""
     
-    async def handle_tool_call(self, tool_name: str, arguments: Dict[str, Any], authorization_header: Optional[str] = None) -> Dict[str, Any]:
-        """Handle MCP tool calls"""
-        print(f"DEBUG: MCPHandler.handle_tool_call - tool: {tool_name}, args: {arguments}")
+    __slots__ = ("apple_client",)
+    
+    def __init__(self):
+        # Process-wide Apple Music client, created at application startup
+        self.apple_client: Optional[AppleMusicClient] = None
+    
+    async def startup(self, http_client: httpx.AsyncClient):
+        """Create the shared Apple Music client on top of the application's HTTP pool"""
+        self.apple_client = AppleMusicClient(http_client)
+    
+    async def _extract_user_token(self, authorization_header: Optional[str]) -> Optional[str]:
+        """Extract MusicKit user token from OAuth Bearer token"""
+        # Auth schemes are case-insensitive (RFC 7235)
+        if not authorization_header or authorization_header[:7].lower() != "bearer ":
+            return None
         
-        # Extract user token from OAuth access token if provided
-        user_token = self._extract_user_token(authorization_header)
+        access_token = authorization_header[7:]
+        if len(access_token) < _MIN_JWT_LENGTH:
+            return None
         
-        apple_client = AppleMusicClient()
-        if user_token:
-            print(f"DEBUG: Extracted user token from OAuth access token")
-            apple_client.user_token = user_token
-        else:
-            print(f"DEBUG: No user token found, using catalog-only access")
+        # A token verified earlier only needs its expiry re-checked
+        cache_key = user_cache_key(access_token)
+        cached = access_token_cache.get(cache_key)
+        if cached is not None:
+            user_token, exp = cached
+            if exp > time.time():
+                return user_token
+            access_token_cache.pop(cache_key, None)
+            return None
         
+        # JWT verification and Fernet decryption are CPU-bound - run them off the event loop
+        decoded = await asyncio.to_thread(self._decode_user_token, access_token)
+        if decoded is None:
+            return None
+        
+        access_token_cache[cache_key] = decoded
+        return decoded[0]
+    
+    def _decode_user_token(self, access_token: str) -> Optional[Tuple[Optional[str], float]]:
+        """Verify an OAuth access token and decrypt the MusicKit user token it carries, with its expiry"""
         try:
-            async with apple_client as client:
-                print(f"DEBUG: Apple Music client context established")
-                if tool_name == "search_songs":
-                    return await self._search_songs(client, arguments)
-                elif tool_name == "get_library_stats":
-                    return await self._get_library_stats(client, arguments)
-                elif tool_name == "get_recently_played":
-                    return await self._get_recently_played(client, arguments)
-                elif tool_name == "search_library":
-                    return await self._search_library(client, arguments)
-                elif tool_name == "rate_song":
-                    return await self._rate_song(client, arguments)
-                elif tool_name == "create_playlist":
-                    return await self._create_playlist(client, arguments)
-                elif tool_name == "add_to_library":
-                    return await self._add_to_library(client, arguments)
-                elif tool_name == "batch_add_to_playlist":
-                    return await self._batch_add_to_playlist(client, arguments)
-                elif tool_name == "bulk_playlist_operations":
-                    return await self._bulk_playlist_operations(client, arguments)
-                elif tool_name == "efficient_library_search":
-                    return await self._efficient_library_search(client, arguments)
-                else:
-                    raise ValueError(f"Unknown tool: {tool_name}")
-        except Exception as e:
-            print(f"ERROR: MCPHandler.handle_tool_call failed - {type(e).__name__}: {e}")
-            import traceback
-            print(f"ERROR: Full traceback:\n{traceback.format_exc()}")
+            payload = _JWT.decode(access_token, _JWT_KEY, algorithms=_JWT_ALGORITHMS)
+            encrypted_user_token = payload["apple_user_token"]
+            user_token = decrypt_token(encrypted_user_token) if encrypted_user_token else None
+            return user_token, payload["exp"]
+        except (jwt.InvalidTokenError, InvalidToken) as e:
+            logger.debug("Failed to extract user token: %s", e)
+            return None
+    
+    async def get_tools(self) -> Tuple[Dict[str, Any], ...]:
+        """Return available MCP tools"""
+        return _TOOLS
+    
+    def get_tools_json(self) -> bytes:
+        """Return the available MCP tools as pre-serialized JSON"""
+        return _TOOLS_JSON
+    
+    async def handle_tool_call(self, tool_name: str, arguments: Dict[str, Any], authorization_header: Optional[str] = None) -> Dict[str, Any]:
+        """Handle MCP tool calls"""
+        logger.debug("MCPHandler.handle_tool_call - tool: %s, args: %s", tool_name, arguments)
+        
+        try:
+            entry = self._TOOL_HANDLERS.get(tool_name)
+            if entry is None:
+                raise ValueError(f"Unknown tool: {tool_name}")
+            handler, args_model, needs_user_token = entry
+            
+            try:
+                args = args_model.model_validate(arguments or {})
+            except ValidationError as e:
+                details = "; ".join(
+                    f"{'.'.join(str(part) for part in error['loc']) or 'arguments'}: {error['msg']}"
+                    for error in e.errors()
+                )
+                raise ValueError(f"Invalid arguments for {tool_name}: {details}") from None
+            
+            if not needs_user_token:
+                # Catalog-only tools skip the token decode entirely
+                return await handler(self, self.apple_client, args)
+            
+            # Extract user token from OAuth access token if provided
+            user_token = await self._extract_user_token(authorization_header)
+            if user_token:
+                logger.debug("Extracted user token from OAuth access token")
+            else:
+                logger.debug("No user token found, using catalog-only access")
+            
+            # Scope the user token to this call; the shared client reads it per request
+            context_token = current_user_token.set(user_token)
+            try:
+                return await handler(self, self.apple_client, args)
+            finally:
+                current_user_token.reset(context_token)
+        except ValueError as e:
+            # Unknown tool or bad arguments - the caller's error, no traceback needed
+            logger.debug("MCPHandler.handle_tool_call rejected %s: %s", tool_name, e)
+            raise
+        except httpx.HTTPError as e:
+            # Upstream failures (rate limits, outages) can come in bursts - log them without a traceback
+            logger.warning("MCPHandler.handle_tool_call upstream error for %s: %s", tool_name, e)
+            raise
+        except Exception:
+            # Traceback is only formatted if a handler actually emits the record
+            logger.exception("MCPHandler.handle_tool_call failed: %s", tool_name)
             raise
     
-    async def _search_songs(self, client: AppleMusicClient, args: Dict[str, Any]) -> Dict[str, Any]:
+    async def _search_songs(self, client: AppleMusicClient, args: SearchSongsArgs) -> Dict[str, Any]:
         """Search Apple Music catalog for songs"""
         # Debug: log what we received
-        print(f"DEBUG: search_songs received args: {args}")
+        logger.debug("search_songs received args: %s", args)
         
-        if "query" not in args:
-            raise ValueError(f"Missing required 'query' parameter. Received args: {args}")
+        query = args.query
+        limit = args.limit
         
-        query = args["query"]
-        limit = args.get("limit", 10)
+        # Serve repeats (including known misses) from memory; cached lists are shared, never mutate them
+        key = (query.strip().casefold(), limit)
+        songs = song_search_cache.get(key)
+        if songs is None:
+            songs = empty_search_cache.get(key)
+        if songs is None:
+            songs = await client.search_songs(query, limit=limit)
+            if songs:
+                song_search_cache[key] = songs
+            else:
+                empty_search_cache[key] = songs
         
-        songs = await client.search_songs(query, limit=limit)
         return {"songs": songs}
     
-    async def _get_library_stats(self, client: AppleMusicClient, args: Dict[str, Any]) -> Dict[str, Any]:
+    async def _get_library_stats(self, client: AppleMusicClient, args: NoArgs) -> Dict[str, Any]:
         """Get library statistics"""
-        # Get basic counts from library endpoints
-        songs = await client.get_library_songs(limit=1)
-        playlists = await client.get_library_playlists(limit=1)
-        albums = await client.get_library_albums(limit=1)
-        artists = await client.get_library_artists(limit=1)
+        if not client.user_token:
+            return await self._fetch_library_stats(client)
+        
+        return await get_or_fetch(
+            library_stats_cache,
+            user_cache_key(client.user_token),
+            lambda: self._fetch_library_stats(client)
+        )
+    
+    def _invalidate_library_stats(self, client: AppleMusicClient):
+        """Forget the cached library totals after the user's library changes"""
+        if client.user_token:
+            library_stats_cache.pop(user_cache_key(client.user_token), None)
+    
+    async def _fetch_library_stats(self, client: AppleMusicClient) -> Dict[str, Any]:
+        """Fetch library totals from Apple Music"""
+        # Get basic counts from library endpoints - the four lookups are independent
+        songs, playlists, albums, artists = await asyncio.gather(
+            client.get_library_songs(limit=1),
+            client.get_library_playlists(limit=1),
+            client.get_library_albums(limit=1),
+            client.get_library_artists(limit=1)
+        )
         
         # Extract totals from meta information
         total_songs = songs.get("meta", {}).get("total", 0)
@@ -321,49 +476,72 @@ class MCPHandler:
             "total_artists": total_artists
         }
     
-    async def _get_recently_played(self, client: AppleMusicClient, args: Dict[str, Any]) -> Dict[str, Any]:
+    async def _get_recently_played(self, client: AppleMusicClient, args: GetRecentlyPlayedArgs) -> Dict[str, Any]:
         """Get recently played tracks"""
-        limit = args.get("limit", 10)
-        return await client.get_recently_played(limit=limit)
+        return await client.get_recently_played(limit=args.limit)
     
-    async def _search_library(self, client: AppleMusicClient, args: Dict[str, Any]) -> Dict[str, Any]:
+    async def _search_library(self, client: AppleMusicClient, args: SearchLibraryArgs) -> Dict[str, Any]:
         """Search user's library"""
-        query = args["query"]
-        types = args.get("types", "library-songs")
-        limit = args.get("limit", 25)
-        
-        return await client.search_library(query, types=types, limit=limit)
+        return await client.search_library(args.query, types=args.types, limit=args.limit)
     
-    async def _rate_song(self, client: AppleMusicClient, args: Dict[str, Any]) -> Dict[str, Any]:
+    async def _rate_song(self, client: AppleMusicClient, args: RateSongArgs) -> Dict[str, Any]:
         """Rate a song"""
-        song_id = args["song_id"]
-        rating = args["rating"]
+        song_id = args.song_id
+        rating = args.rating
         
         result = await client.rate_song(song_id, rating)
         return {"status": "success", "rating": rating, "song_id": song_id}
     
-    async def _create_playlist(self, client: AppleMusicClient, args: Dict[str, Any]) -> Dict[str, Any]:
+    async def _create_playlist(self, client: AppleMusicClient, args: CreatePlaylistArgs) -> Dict[str, Any]:
         """Create a new playlist"""
-        name = args["name"]
-        description = args.get("description")
-        track_ids = args.get("track_ids", [])
-        
-        result = await client.create_playlist(name, description, track_ids)
-        return {"status": "success", "playlist": result}
+        result = await client.create_playlist(args.name, args.description, args.track_ids)
+        self._invalidate_library_stats(client)
+        self._invalidate_playlist_index(client)
+        return {"status": "success", "playlist": result, "track_count": len(args.track_ids)}
     
-    async def _add_to_library(self, client: AppleMusicClient, args: Dict[str, Any]) -> Dict[str, Any]:
+    async def _add_to_library(self, client: AppleMusicClient, args: AddToLibraryArgs) -> Dict[str, Any]:
         """Add songs to library"""
-        song_ids = args["song_ids"]
+        # Drop repeated IDs (keeping first-seen order) so they aren't sent twice
+        song_ids = list(dict.fromkeys(args.song_ids))
+        batch_size = client.TRACK_BATCH_SIZE
+        batches = [song_ids[i:i+batch_size] for i in range(0, len(song_ids), batch_size)]
+        
+        # Batches are independent - send them concurrently, bounded like other writes
+        semaphore = asyncio.Semaphore(client.WRITE_CONCURRENCY)
+        
+        async def add_batch(batch: List[str]) -> Dict[str, Any]:
+            async with semaphore:
+                return await client.add_to_library(batch)
+        
+        batch_results = await asyncio.gather(*[add_batch(batch) for batch in batches], return_exceptions=True)
+        self._invalidate_library_stats(client)
+        
+        added = 0
+        errors = []
+        for batch, result in zip(batches, batch_results):
+            if isinstance(result, Exception):
+                errors.append(str(result))
+            else:
+                added += len(batch)
         
-        result = await client.add_to_library(song_ids)
-        return {"status": "success", "added_songs": len(song_ids)}
+        # Nothing went through - surface the failure as before rather than a "partial" result
+        if batch_results and all(isinstance(result, Exception) for result in batch_results):
+            raise batch_results[0]
+        
+        return {
+            "status": "partial" if errors else "success",
+            "requested_songs": len(args.song_ids),
+            "unique_songs": len(song_ids),
+            "added_songs": added,
+            "errors": errors
+        }
     
-    async def _batch_add_to_playlist(self, client: AppleMusicClient, args: Dict[str, Any]) -> Dict[str, Any]:
+    async def _batch_add_to_playlist(self, client: AppleMusicClient, args: BatchAddToPlaylistArgs) -> Dict[str, Any]:
         """Add multiple songs to playlist with minimal API calls"""
-        playlist_identifier = args["playlist_identifier"]
-        songs = args["songs"]
-        create_if_missing = args.get("create_if_missing", False)
-        deduplicate = args.get("deduplicate", True)
+        playlist_identifier = args.playlist_identifier
+        songs = args.songs
+        create_if_missing = args.create_if_missing
+        deduplicate = args.deduplicate
         
         results = {
             "status": "success",
@@ -377,14 +555,13 @@ class MCPHandler:
             playlist_id = playlist_identifier
         else:
             # Search for playlist by name
-            playlists = await client.get_library_playlists(limit=100)
-            for pl in playlists.get("data", []):
-                if pl["attributes"]["name"].lower() == playlist_identifier.lower():
-                    playlist_id = pl["id"]
-                    break
+            playlist_index = await self._get_playlist_index(client)
+            playlist_id = playlist_index.get(playlist_identifier.lower())
             
             if not playlist_id and create_if_missing:
                 result = await client.create_playlist(playlist_identifier)
+                self._invalidate_library_stats(client)
+                self._invalidate_playlist_index(client)
                 playlist_id = result["data"][0]["id"]
         
         if not playlist_id:
@@ -395,52 +572,50 @@ class MCPHandler:
         # Step 2: Prepare songs for addition
         songs_to_search = []
         track_data = []
+        successful = failed = 0
         
         for song in songs:
             if isinstance(song, str):
                 # Assume it's a catalog ID
                 track_data.append({"id": song, "type": "songs"})
-                results["summary"]["successful"] += 1
+                successful += 1
             else:
                 # Need to search for this song
                 songs_to_search.append(song)
         
-        # Step 3: Batch search for non-ID songs
+        # Step 3: Batch search for non-ID songs, concurrently and in input order
         if songs_to_search:
-            # Create efficient search queries
-            for song_info in songs_to_search:
-                query_parts = []
-                if song_info.get("artist"):
-                    query_parts.append(song_info["artist"])
-                if song_info.get("title"):
-                    query_parts.append(song_info["title"])
+            queries = [query for query in map(_song_query, songs_to_search) if query]
+            search_results_list = await client.parallel_search(queries, "catalog", "songs", 5)
+            
+            for query, search_results in zip(queries, search_results_list):
+                if isinstance(search_results, Exception):
+                    results["errors"].append(f"Song search failed: {query} ({search_results})")
+                    failed += 1
+                    continue
                 
-                if query_parts:
-                    query = " ".join(query_parts)
-                    search_results = await client.search_catalog(query, types="songs", limit=5)
-                    
-                    # Find best match
-                    songs_data = search_results.get("results", {}).get("songs", {}).get("data", [])
-                    if songs_data:
-                        # Simple matching - take first result
-                        track_data.append({"id": songs_data[0]["id"], "type": "songs"})
-                        results["summary"]["successful"] += 1
-                    else:
-                        results["errors"].append(f"Song not found: {query}")
-                        results["summary"]["failed"] += 1
+                # Find best match
+                songs_data = search_results.get("results", {}).get("songs", {}).get("data", [])
+                if songs_data:
+                    track_data.append({"id": _best_match(query, songs_data)["id"], "type": "songs"})
+                    successful += 1
+                else:
+                    results["errors"].append(f"Song not found: {query}")
+                    failed += 1
+        
+        results["summary"]["successful"] = successful
+        results["summary"]["failed"] = failed
         
         # Step 4: Deduplicate if requested
         if deduplicate:
             try:
                 existing_tracks = await client.get_playlist_tracks(playlist_id)
-                existing_ids = {t.get("attributes", {}).get("playParams", {}).get("catalogId") 
-                               for t in existing_tracks if t.get("attributes", {}).get("playParams", {}).get("catalogId")}
+                existing_ids = frozenset(filter(None, map(_catalog_id, existing_tracks)))
                 
                 track_data = [t for t in track_data if t["id"] not in existing_ids]
             except Exception as e:
                 # If deduplication fails, continue without it
-                print(f"DEBUG: Deduplication failed, continuing without it: {e}")
-                pass
+                logger.debug("Deduplication failed, continuing without it: %s", e)
         
         # Step 5: Add tracks to playlist
         if track_data:
@@ -450,10 +625,36 @@ class MCPHandler:
         results["playlist_id"] = playlist_id
         return results
 
-    async def _bulk_playlist_operations(self, client: AppleMusicClient, args: Dict[str, Any]) -> Dict[str, Any]:
+    async def _get_playlist_index(self, client: AppleMusicClient) -> Dict[str, str]:
+        """Map lowercased library playlist names to IDs, cached per user"""
+        if not client.user_token:
+            return await self._fetch_playlist_index(client)
+        
+        return await get_or_fetch(
+            playlist_index_cache,
+            user_cache_key(client.user_token),
+            lambda: self._fetch_playlist_index(client)
+        )
+    
+    async def _fetch_playlist_index(self, client: AppleMusicClient) -> Dict[str, str]:
+        """Fetch library playlists and index them by lowercased name"""
+        playlists = await client.get_library_playlists(limit=100)
+        
+        # Iterate in reverse so the first playlist with a given name wins, as the linear scan did
+        return {
+            pl["attributes"]["name"].lower(): pl["id"]
+            for pl in reversed(playlists.get("data", []))
+        }
+    
+    def _invalidate_playlist_index(self, client: AppleMusicClient):
+        """Forget the cached playlist index after the user's playlists change"""
+        if client.user_token:
+            playlist_index_cache.pop(user_cache_key(client.user_token), None)
+
+    async def _bulk_playlist_operations(self, client: AppleMusicClient, args: BulkPlaylistOperationsArgs) -> Dict[str, Any]:
         """Execute bulk playlist operations"""
-        operations = args["operations"]
-        batch_mode = args.get("batch_mode", "parallel")
+        operations = args.operations
+        batch_mode = args.batch_mode
         
         results = {
             "status": "success",
@@ -463,11 +664,20 @@ class MCPHandler:
         
         # Process operations
         if batch_mode == "parallel":
-            # Use asyncio.gather for parallel execution
-            operation_results = await asyncio.gather(
-                *[self._execute_playlist_operation(client, op) for op in operations],
-                return_exceptions=True
-            )
+            # Run operations in a task group; each one reports its own errors, and an
+            # auth failure cancels the rest instead of letting them fail one by one
+            operation_results = [None] * len(operations)
+            
+            async def run_operation(index: int, op: Dict[str, Any]):
+                operation_results[index] = await self._execute_playlist_operation(client, op)
+            
+            try:
+                async with asyncio.TaskGroup() as task_group:
+                    for index, op in enumerate(operations):
+                        task_group.create_task(run_operation(index, op))
+            except ExceptionGroup as group:
+                # Surface the first failure, chained to the group so the rest aren't lost
+                raise group.exceptions[0] from group
         else:
             # Sequential execution
             operation_results = []
@@ -476,26 +686,16 @@ class MCPHandler:
                 operation_results.append(result)
         
         # Process results
-        for i, result in enumerate(operation_results):
-            if isinstance(result, Exception):
-                results["operations"].append({
-                    "operation": operations[i],
-                    "status": "error",
-                    "error": str(result)
-                })
-                results["summary"]["failed"] += 1
-            else:
-                results["operations"].append(result)
-                if result["status"] == "success":
-                    results["summary"]["successful"] += 1
-                else:
-                    results["summary"]["failed"] += 1
+        successful = sum(result["status"] == "success" for result in operation_results)
+        results["operations"] = operation_results
+        results["summary"]["successful"] = successful
+        results["summary"]["failed"] = len(operation_results) - successful
         
         return results
 
     async def _execute_playlist_operation(self, client: AppleMusicClient, operation: Dict[str, Any]) -> Dict[str, Any]:
         """Execute a single playlist operation"""
-        op_type = operation["operation"]
+        op_type = operation.get("operation")
         
         try:
             if op_type == "create":
@@ -505,29 +705,32 @@ class MCPHandler:
                 
                 # First create the playlist
                 playlist_result = await client.create_playlist(name)
+                self._invalidate_library_stats(client)
+                self._invalidate_playlist_index(client)
                 playlist_id = playlist_result["data"][0]["id"]
                 
                 # Then add songs if provided
                 if songs:
-                    # Convert songs to track data using batch_add logic
+                    # Convert songs to track data using batch_add logic; catalog IDs need no
+                    # lookup, the rest are searched concurrently
+                    queries = [_song_query(song) for song in songs if not isinstance(song, str)]
+                    search_results_list = iter(await client.parallel_search(
+                        [query for query in queries if query], "catalog", "songs", 1
+                    ))
+                    
+                    # Rebuild track data in the caller's order
                     track_data = []
+                    queries = iter(queries)
                     for song in songs:
                         if isinstance(song, str):
                             track_data.append({"id": song, "type": "songs"})
-                        else:
-                            # Search for song
-                            query_parts = []
-                            if song.get("artist"):
-                                query_parts.append(song["artist"])
-                            if song.get("title"):
-                                query_parts.append(song["title"])
-                            
-                            if query_parts:
-                                query = " ".join(query_parts)
-                                search_results = await client.search_catalog(query, types="songs", limit=1)
-                                songs_data = search_results.get("results", {}).get("songs", {}).get("data", [])
-                                if songs_data:
-                                    track_data.append({"id": songs_data[0]["id"], "type": "songs"})
+                        elif next(queries):
+                            search_results = next(search_results_list)
+                            if isinstance(search_results, Exception):
+                                raise search_results
+                            songs_data = search_results.get("results", {}).get("songs", {}).get("data", [])
+                            if songs_data:
+                                track_data.append({"id": songs_data[0]["id"], "type": "songs"})
                     
                     if track_data:
                         await client.add_tracks_to_playlist(playlist_id, track_data)
@@ -539,12 +742,8 @@ class MCPHandler:
                 playlist_name = operation["playlist_name"]
                 
                 # Find playlist ID by name
-                playlists = await client.get_library_playlists(limit=100)
-                playlist_id = None
-                for pl in playlists.get("data", []):
-                    if pl["attributes"]["name"].lower() == playlist_name.lower():
-                        playlist_id = pl["id"]
-                        break
+                playlist_index = await self._get_playlist_index(client)
+                playlist_id = playlist_index.get(playlist_name.lower())
                 
                 if not playlist_id:
                     return {"status": "error", "operation": op_type, "error": f"Playlist '{playlist_name}' not found"}
@@ -561,15 +760,17 @@ class MCPHandler:
                 return {"status": "error", "operation": op_type, "error": f"Operation '{op_type}' not yet implemented"}
                 
         except Exception as e:
+            if isinstance(e, httpx.HTTPStatusError) and e.response.status_code in _FATAL_STATUS_CODES:
+                raise
             return {"status": "error", "operation": op_type, "error": str(e)}
 
-    async def _efficient_library_search(self, client: AppleMusicClient, args: Dict[str, Any]) -> Dict[str, Any]:
+    async def _efficient_library_search(self, client: AppleMusicClient, args: EfficientLibrarySearchArgs) -> Dict[str, Any]:
         """Efficient multi-query search"""
-        queries = args["queries"]
-        search_scope = args.get("search_scope", ["both"])
-        types = args.get("types", ["songs"])
-        return_format = args.get("return_format", "minimal")
-        limit = args.get("limit_per_query", 10)
+        queries = args.queries
+        search_scope = args.search_scope
+        types = args.types
+        return_format = args.return_format
+        limit = args.limit_per_query
         
         results = {
             "status": "success",
@@ -577,66 +778,61 @@ class MCPHandler:
             "summary": {"total_queries": len(queries), "total_results": 0}
         }
         
+        # Identical queries (up to case and surrounding whitespace) are searched only once
+        distinct_queries: Dict[str, str] = {}
+        for query in queries:
+            distinct_queries.setdefault(query.strip().casefold(), query)
+        
+        # One parallel_search per (scope, type) covering every distinct query, all running
+        # concurrently under a single bound for the whole call
+        scopes = [
+            scope for scope in ("library", "catalog")
+            if scope in search_scope or "both" in search_scope
+        ]
+        searches = [(scope, type_name) for scope in scopes for type_name in types]
+        semaphore = asyncio.Semaphore(client.SEARCH_CONCURRENCY)
+        grouped_results = await asyncio.gather(*[
+            client.parallel_search(list(distinct_queries.values()), scope, type_name, limit, semaphore)
+            for scope, type_name in searches
+        ])
+        
+        fetched = {}
+        for (scope, type_name), group in zip(searches, grouped_results):
+            for normalized_query, result in zip(distinct_queries, group):
+                fetched[scope, type_name, normalized_query] = result
+        
+        # Pick the per-item shape once per type rather than re-checking the format per item
+        extractors = {type_name: _item_extractor(return_format, type_name) for type_name in types}
+        
         for query in queries:
             query_results = {"library": [], "catalog": []}
-            
-            # Execute searches based on scope
-            search_tasks = []
-            
-            if "library" in search_scope or "both" in search_scope:
-                for type_name in types:
-                    search_tasks.append(("library", type_name, 
-                        client.search_library(query, types=f"library-{type_name}", limit=limit)))
-            
-            if "catalog" in search_scope or "both" in search_scope:
-                for type_name in types:
-                    search_tasks.append(("catalog", type_name,
-                        client.search_catalog(query, types=type_name, limit=limit)))
-            
-            # Execute all searches for this query in parallel
-            search_results = await asyncio.gather(*[task[2] for task in search_tasks], return_exceptions=True)
+            normalized_query = query.strip().casefold()
             
             # Process results based on return_format
-            for i, result in enumerate(search_results):
+            for scope, type_name in searches:
+                result = fetched[scope, type_name, normalized_query]
                 if isinstance(result, Exception):
                     continue
-                    
-                scope, type_name = search_tasks[i][0], search_tasks[i][1]
                 
-                if return_format == "ids_only":
-                    # Extract just IDs
-                    items = result.get("results", {}).get(type_name, {}).get("data", [])
-                    ids = [item["id"] for item in items]
-                    query_results[scope].extend(ids)
-                    
-                elif return_format == "minimal":
-                    # Extract ID, name, and key attributes
-                    items = result.get("results", {}).get(type_name, {}).get("data", [])
-                    minimal_items = []
-                    
-                    for item in items:
-                        attrs = item.get("attributes", {})
-                        minimal_item = {
-                            "id": item["id"],
-                            "name": attrs.get("name"),
-                            "type": type_name
-                        }
-                        
-                        # Add type-specific attributes
-                        if type_name == "songs":
-                            minimal_item["artist"] = attrs.get("artistName")
-                            minimal_item["catalog_id"] = attrs.get("playParams", {}).get("catalogId")
-                            minimal_item["isrc"] = attrs.get("isrc")
-                        
-                        minimal_items.append(minimal_item)
-                        
-                    query_results[scope].extend(minimal_items)
-                    
-                else:  # full
-                    items = result.get("results", {}).get(type_name, {}).get("data", [])
-                    query_results[scope].extend(items)
+                items = result.get("results", {}).get(type_name, {}).get("data", [])
+                query_results[scope].extend(map(extractors[type_name], items))
             
             results["queries"][query] = query_results
             results["summary"]["total_results"] += len(query_results["library"]) + len(query_results["catalog"])
         
-        return results
\ No newline at end of file
+        return results
+    
+    # Tool name -> (handler, argument model, needs user token), looked up once per call
+    # instead of walking an if/elif chain
+    _TOOL_HANDLERS = {
+        "search_songs": (_search_songs, SearchSongsArgs, False),
+        "get_library_stats": (_get_library_stats, NoArgs, True),
+        "get_recently_played": (_get_recently_played, GetRecentlyPlayedArgs, True),
+        "search_library": (_search_library, SearchLibraryArgs, True),
+        "rate_song": (_rate_song, RateSongArgs, True),
+        "create_playlist": (_create_playlist, CreatePlaylistArgs, True),
+        "add_to_library": (_add_to_library, AddToLibraryArgs, True),
+        "batch_add_to_playlist": (_batch_add_to_playlist, BatchAddToPlaylistArgs, True),
+        "bulk_playlist_operations": (_bulk_playlist_operations, BulkPlaylistOperationsArgs, True),
+        "efficient_library_search": (_efficient_library_search, EfficientLibrarySearchArgs, True),
+    }
\ No newline at end of file
@@ -0,0 +1,51 @@
+from typing import Dict, List, Any, Literal, Optional, Union
+from pydantic import BaseModel, Field
+
+# Typed arguments for each MCP tool, validated once at the dispatch boundary.
+# Constraints mirror each tool's inputSchema so bad calls are rejected before
+# reaching Apple Music. Unknown keys are ignored, matching the previous
+# dict-based handling.
+
+class NoArgs(BaseModel):
+    pass
+
+class SearchSongsArgs(BaseModel):
+    query: str
+    limit: int = 10
+
+class GetRecentlyPlayedArgs(BaseModel):
+    limit: int = 10
+
+class SearchLibraryArgs(BaseModel):
+    query: str
+    types: str = "library-songs"
+    limit: int = 25
+
+class RateSongArgs(BaseModel):
+    song_id: str
+    rating: int = Field(ge=1, le=5)
+
+class CreatePlaylistArgs(BaseModel):
+    name: str
+    description: Optional[str] = None
+    track_ids: List[str] = []
+
+class AddToLibraryArgs(BaseModel):
+    song_ids: List[str]
+
+class BatchAddToPlaylistArgs(BaseModel):
+    playlist_identifier: str
+    songs: List[Union[str, Dict[str, Any]]]
+    create_if_missing: bool = False
+    deduplicate: bool = True
+
+class BulkPlaylistOperationsArgs(BaseModel):
+    operations: List[Dict[str, Any]]
+    batch_mode: Literal["sequential", "parallel"] = "parallel"
+
+class EfficientLibrarySearchArgs(BaseModel):
+    queries: List[str]
+    search_scope: List[Literal["library", "catalog", "both"]] = ["both"]
+    types: List[Literal["songs", "albums", "artists", "playlists"]] = ["songs"]
+    return_format: Literal["ids_only", "minimal", "full"] = "minimal"
+    limit_per_query: int = 10
@@ -0,0 +1,28 @@
+import os
+import tempfile
+
+from cryptography.fernet import Fernet
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import ec
+
+# Settings are read at import time, so configure a throwaway environment before any
+# app module is imported: a temporary SQLite database and a freshly generated key pair
+_TEST_DIR = tempfile.mkdtemp(prefix="apple-music-mcp-tests-")
+_PRIVATE_KEY_PATH = os.path.join(_TEST_DIR, "AuthKey.p8")
+
+with open(_PRIVATE_KEY_PATH, "wb") as key_file:
+    key_file.write(ec.generate_private_key(ec.SECP256R1()).private_bytes(
+        serialization.Encoding.PEM,
+        serialization.PrivateFormat.PKCS8,
+        serialization.NoEncryption()
+    ))
+
+os.environ.update({
+    "APPLE_TEAM_ID": "TEAMID",
+    "APPLE_KEY_ID": "KEYID",
+    "APPLE_PRIVATE_KEY_PATH": _PRIVATE_KEY_PATH,
+    "JWT_SECRET_KEY": "test-jwt-secret-key-with-enough-length",
+    "TOKEN_ENCRYPTION_KEY": Fernet.generate_key().decode(),
+    "DATABASE_URL": f"sqlite:///{os.path.join(_TEST_DIR, 'test.db')}",
+    "DEBUG": "false",
+})
@@ -0,0 +1,244 @@
+import asyncio
+
+import httpx
+import orjson
+import pytest
+
+from app.core.cache import catalog_cache
+from app.services.apple_music import AppleMusicClient
+
+
+def _client(handler) -> AppleMusicClient:
+    client = AppleMusicClient(httpx.AsyncClient(transport=httpx.MockTransport(handler)))
+    # Retry timing isn't under test - don't sleep between attempts
+    client._backoff = lambda attempt, retry_after=None: 0
+    return client
+
+
+def _responder(*statuses):
+    calls = []
+    
+    def handler(request: httpx.Request) -> httpx.Response:
+        calls.append(request.method)
+        status = statuses[min(len(calls), len(statuses)) - 1]
+        return httpx.Response(status, json={"data": []} if status == 200 else {"errors": []})
+    
+    return handler, calls
+
+
+@pytest.mark.asyncio
+async def test_get_is_retried_on_server_error():
+    handler, calls = _responder(503, 502, 200)
+    
+    result = await _client(handler)._make_request("GET", "/catalog/us/charts")
+    
+    assert result == {"data": []}
+    assert calls == ["GET", "GET", "GET"]
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("method", ["POST", "DELETE"])
+async def test_non_idempotent_methods_are_not_retried_on_server_error(method):
+    handler, calls = _responder(503, 200)
+    
+    with pytest.raises(httpx.HTTPStatusError):
+        await _client(handler)._make_request(method, "/me/library/playlists/p.1/tracks", json_data={"data": []})
+    
+    assert calls == [method]
+
+
+@pytest.mark.asyncio
+async def test_rate_limit_is_retried_for_any_method():
+    handler, calls = _responder(429, 200)
+    
+    await _client(handler)._make_request("POST", "/me/library", json_data={"data": []})
+    
+    assert calls == ["POST", "POST"]
+
+
+@pytest.mark.asyncio
+async def test_retries_stop_after_max_retries():
+    handler, calls = _responder(503)
+    
+    with pytest.raises(httpx.HTTPStatusError):
+        await _client(handler)._make_request("GET", "/catalog/us/charts")
+    
+    assert len(calls) == AppleMusicClient.MAX_RETRIES + 1
+
+
+@pytest.mark.asyncio
+async def test_delete_is_not_retried_on_transport_error():
+    calls = []
+    
+    def handler(request: httpx.Request) -> httpx.Response:
+        calls.append(request.method)
+        raise httpx.ReadTimeout("timed out", request=request)
+    
+    with pytest.raises(httpx.ReadTimeout):
+        await _client(handler)._make_request("DELETE", "/me/library/playlists/p.1/tracks", json_data={"data": []})
+    
+    assert calls == ["DELETE"]
+
+
+def _track_pages(total: int, fail_at=None, delays=None):
+    requested = []
+    finished = []
+    
+    async def handler(request: httpx.Request) -> httpx.Response:
+        offset = int(request.url.params["offset"])
+        limit = int(request.url.params["limit"])
+        requested.append(offset)
+        if offset == fail_at:
+            return httpx.Response(404, json={"errors": []})
+        await asyncio.sleep((delays or {}).get(offset, 0))
+        finished.append(offset)
+        page = {
+            "data": [{"id": f"i.{index}"} for index in range(offset, min(offset + limit, total))],
+            "meta": {"total": total}
+        }
+        if offset + limit < total:
+            page["next"] = f"/v1/me/library/playlists/p.1/tracks?offset={offset + limit}"
+        return httpx.Response(200, json=page)
+    
+    return handler, requested, finished
+
+
+@pytest.mark.asyncio
+async def test_playlist_pages_are_fetched_concurrently_in_order():
+    # Later pages answer first; the result still follows playlist order
+    handler, requested, finished = _track_pages(700, delays={300: 0.05})
+    
+    tracks = await _client(handler).get_playlist_tracks("p.1")
+    
+    assert [track["id"] for track in tracks] == [f"i.{index}" for index in range(700)]
+    assert sorted(requested) == [0, 300, 600]
+    assert finished == [0, 600, 300]
+
+
+@pytest.mark.asyncio
+async def test_failed_playlist_page_cancels_the_rest_and_propagates():
+    handler, requested, finished = _track_pages(1500, fail_at=600, delays={300: 5, 900: 5, 1200: 5})
+    
+    with pytest.raises(httpx.HTTPStatusError):
+        await asyncio.wait_for(_client(handler).get_playlist_tracks("p.1"), timeout=2)
+    
+    assert finished == [0]
+
+
+@pytest.mark.asyncio
+async def test_missing_first_page_reads_as_an_empty_playlist():
+    handler, requested, finished = _track_pages(0, fail_at=0)
+    
+    assert await _client(handler).get_playlist_tracks("p.1") == []
+
+
+def _track_posts():
+    posts = []
+    in_flight = 0
+    
+    async def handler(request: httpx.Request) -> httpx.Response:
+        nonlocal in_flight
+        in_flight += 1
+        assert in_flight == 1, "playlist batches were posted concurrently"
+        await asyncio.sleep(0.01)
+        in_flight -= 1
+        body = orjson.loads(request.content)
+        if request.url.path == "/v1/me/library/playlists":
+            refs = body.get("relationships", {}).get("tracks", {}).get("data", [])
+            posts.append(("create", [ref["id"] for ref in refs]))
+            return httpx.Response(201, json={"data": [{"id": "p.1"}]})
+        posts.append(("add", [ref["id"] for ref in body["data"]]))
+        return httpx.Response(204)
+    
+    return handler, posts
+
+
+@pytest.mark.asyncio
+async def test_track_batches_are_posted_one_at_a_time_in_order():
+    handler, posts = _track_posts()
+    track_data = [{"id": str(index), "type": "songs"} for index in range(250)]
+    
+    await _client(handler).add_tracks_to_playlist("p.1", track_data)
+    
+    assert posts == [
+        ("add", [str(index) for index in range(0, 100)]),
+        ("add", [str(index) for index in range(100, 200)]),
+        ("add", [str(index) for index in range(200, 250)]),
+    ]
+
+
+@pytest.mark.asyncio
+async def test_create_playlist_sends_first_batch_inline_and_appends_the_rest():
+    handler, posts = _track_posts()
+    track_ids = [str(index) for index in range(250)]
+    
+    result = await _client(handler).create_playlist("Road Trip", track_ids=track_ids)
+    
+    assert result["data"][0]["id"] == "p.1"
+    assert posts == [
+        ("create", track_ids[:100]),
+        ("add", track_ids[100:200]),
+        ("add", track_ids[200:]),
+    ]
+
+
+@pytest.fixture
+def empty_catalog_cache():
+    catalog_cache.clear()
+    yield
+    catalog_cache.clear()
+
+
+@pytest.mark.asyncio
+async def test_concurrent_identical_catalog_requests_share_one_call(empty_catalog_cache):
+    terms = []
+    
+    async def handler(request: httpx.Request) -> httpx.Response:
+        terms.append(request.url.params["term"])
+        await asyncio.sleep(0.01)
+        return httpx.Response(200, json={"results": {}})
+    
+    client = _client(handler)
+    results = await asyncio.gather(*[client.search_catalog("Daft Punk") for _ in range(5)])
+    
+    assert results == [{"results": {}}] * 5
+    assert terms == ["Daft Punk"]
+
+
+@pytest.mark.asyncio
+async def test_cancelled_first_caller_does_not_cancel_the_others(empty_catalog_cache):
+    release = asyncio.Event()
+    
+    async def handler(request: httpx.Request) -> httpx.Response:
+        await release.wait()
+        return httpx.Response(200, json={"results": {}})
+    
+    client = _client(handler)
+    first = asyncio.create_task(client.search_catalog("Justice"))
+    await asyncio.sleep(0)
+    second = asyncio.create_task(client.search_catalog("Justice"))
+    await asyncio.sleep(0)
+    
+    first.cancel()
+    await asyncio.sleep(0)
+    release.set()
+    
+    assert await second == {"results": {}}
+    assert first.cancelled()
+    assert len(catalog_cache) == 1
+
+
+@pytest.mark.asyncio
+async def test_failed_catalog_request_reaches_every_caller_and_is_not_cached(empty_catalog_cache):
+    async def handler(request: httpx.Request) -> httpx.Response:
+        await asyncio.sleep(0.01)
+        return httpx.Response(404, json={"errors": []})
+    
+    client = _client(handler)
+    results = await asyncio.gather(
+        *[client.search_catalog("Nobody") for _ in range(3)],
+        return_exceptions=True
+    )
+    
+    assert all(isinstance(result, httpx.HTTPStatusError) for result in results)
+    assert len(catalog_cache) == 0
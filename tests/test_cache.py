@@ -0,0 +1,64 @@
+import asyncio
+
+import pytest
+from cachetools import TTLCache
+
+from app.core.cache import get_or_fetch
+
+
+@pytest.mark.asyncio
+async def test_concurrent_misses_share_one_fetch():
+    cache = TTLCache(maxsize=10, ttl=60)
+    calls = 0
+    
+    async def fetch():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.01)
+        return "value"
+    
+    results = await asyncio.gather(*[get_or_fetch(cache, "key", fetch) for _ in range(5)])
+    
+    assert results == ["value"] * 5
+    assert calls == 1
+    assert cache["key"] == "value"
+
+
+@pytest.mark.asyncio
+async def test_cancelled_owner_does_not_cancel_waiters():
+    cache = TTLCache(maxsize=10, ttl=60)
+    release = asyncio.Event()
+    
+    async def fetch():
+        await release.wait()
+        return "value"
+    
+    owner = asyncio.create_task(get_or_fetch(cache, "key", fetch))
+    await asyncio.sleep(0)
+    waiter = asyncio.create_task(get_or_fetch(cache, "key", fetch))
+    await asyncio.sleep(0)
+    
+    owner.cancel()
+    await asyncio.sleep(0)
+    release.set()
+    
+    assert await waiter == "value"
+    assert owner.cancelled()
+    assert cache["key"] == "value"
+
+
+@pytest.mark.asyncio
+async def test_fetch_errors_reach_every_waiter_and_are_not_cached():
+    cache = TTLCache(maxsize=10, ttl=60)
+    
+    async def fetch():
+        await asyncio.sleep(0.01)
+        raise ValueError("upstream failed")
+    
+    results = await asyncio.gather(
+        *[get_or_fetch(cache, "key", fetch) for _ in range(3)],
+        return_exceptions=True
+    )
+    
+    assert all(isinstance(result, ValueError) for result in results)
+    assert "key" not in cache
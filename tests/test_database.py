@@ -0,0 +1,50 @@
+import sqlite3
+
+from fastapi.testclient import TestClient
+
+from app.core.config import settings
+from app.core.security import ENCRYPTED_TOKEN_PREFIX, decrypt_token, encrypt_token
+from app.main import app
+
+
+def _query(sql: str, *params):
+    with sqlite3.connect(settings.database_url.removeprefix("sqlite:///")) as connection:
+        return connection.execute(sql, params).fetchall()
+
+
+def test_startup_encrypts_plaintext_apple_tokens():
+    # Create the tables, then plant rows the way versions before encryption at rest wrote them
+    with TestClient(app):
+        pass
+    encrypted = encrypt_token("already-encrypted")
+    bare = encrypt_token("bare-ciphertext").removeprefix(ENCRYPTED_TOKEN_PREFIX)
+    _query(
+        "INSERT INTO access_tokens (access_token_jti, refresh_token, client_id, apple_user_token, apple_refresh_token) "
+        "VALUES (?, ?, ?, ?, ?), (?, ?, ?, ?, ?), (?, ?, ?, ?, ?)",
+        "legacy-jti", "legacy-refresh", "legacy-client", "plain-user-token", "plain-refresh-token",
+        "current-jti", "current-refresh", "legacy-client", encrypted, None,
+        "bare-jti", "bare-refresh", "legacy-client", bare, None
+    )
+    _query(
+        "INSERT INTO authorization_code_grants (code, client_id, apple_user_token) VALUES (?, ?, ?)",
+        "legacy-code", "legacy-client", "plain-user-token"
+    )
+    
+    with TestClient(app):
+        pass
+    
+    (user_token, refresh_token), = _query(
+        "SELECT apple_user_token, apple_refresh_token FROM access_tokens WHERE access_token_jti = ?", "legacy-jti"
+    )
+    assert decrypt_token(user_token) == "plain-user-token"
+    assert decrypt_token(refresh_token) == "plain-refresh-token"
+    assert _query(
+        "SELECT apple_user_token, apple_refresh_token FROM access_tokens WHERE access_token_jti = ?", "current-jti"
+    ) == [(encrypted, None)]
+    # Ciphertext written before the marker existed is marked, not encrypted twice
+    assert _query(
+        "SELECT apple_user_token FROM access_tokens WHERE access_token_jti = ?", "bare-jti"
+    ) == [(ENCRYPTED_TOKEN_PREFIX + bare,)]
+    
+    (grant_token,), = _query("SELECT apple_user_token FROM authorization_code_grants WHERE code = ?", "legacy-code")
+    assert decrypt_token(grant_token) == "plain-user-token"
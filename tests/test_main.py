@@ -0,0 +1,24 @@
+from fastapi.testclient import TestClient
+from starlette.responses import PlainTextResponse
+
+from app.main import SSEAwareGZipMiddleware
+
+BODY = "tool result " * 200
+
+
+def _client() -> TestClient:
+    return TestClient(SSEAwareGZipMiddleware(PlainTextResponse(BODY), minimum_size=1024))
+
+
+def test_large_responses_are_gzipped():
+    response = _client().get("/", headers={"Accept-Encoding": "gzip"})
+    
+    assert response.headers["content-encoding"] == "gzip"
+    assert response.text == BODY
+
+
+def test_event_stream_requests_bypass_compression():
+    response = _client().get("/", headers={"Accept-Encoding": "gzip", "Accept": "text/event-stream"})
+    
+    assert "content-encoding" not in response.headers
+    assert response.text == BODY
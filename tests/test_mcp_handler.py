@@ -0,0 +1,262 @@
+import asyncio
+import time
+
+import httpx
+import jwt
+import orjson
+import pytest
+
+from app.core.cache import access_token_cache, library_stats_cache, playlist_index_cache, user_cache_key
+from app.core.config import settings
+from app.core.security import encrypt_token
+from app.services.mcp_handler import MCPHandler, _best_match
+
+
+def _access_token(user_token: str, expires_in: int = 3600) -> str:
+    now = int(time.time())
+    return jwt.encode(
+        {"sub": "client", "apple_user_token": encrypt_token(user_token), "iat": now, "exp": now + expires_in},
+        settings.jwt_secret_key,
+        algorithm="HS256"
+    )
+
+
+AUTHORIZATION = f"Bearer {_access_token('music-user-token')}"
+
+
+async def _handler(respond) -> MCPHandler:
+    handler = MCPHandler()
+    await handler.startup(httpx.AsyncClient(transport=httpx.MockTransport(respond)))
+    return handler
+
+
+def _song(song_id: str, artist: str, name: str) -> dict:
+    return {"id": song_id, "type": "songs", "attributes": {"artistName": artist, "name": name}}
+
+
+@pytest.fixture(autouse=True)
+def clear_user_caches():
+    for cache in (access_token_cache, library_stats_cache, playlist_index_cache):
+        cache.clear()
+    yield
+    for cache in (access_token_cache, library_stats_cache, playlist_index_cache):
+        cache.clear()
+
+
+@pytest.mark.asyncio
+async def test_verified_token_is_cached_under_a_digest(monkeypatch):
+    handler = MCPHandler()
+    access_token = _access_token("music-user-token")
+    
+    assert await handler._extract_user_token(f"Bearer {access_token}") == "music-user-token"
+    assert access_token not in access_token_cache
+    assert user_cache_key(access_token) in access_token_cache
+    
+    # A cache hit skips verification entirely
+    monkeypatch.setattr(MCPHandler, "_decode_user_token", lambda self, token: pytest.fail("token was verified again"))
+    assert await handler._extract_user_token(f"Bearer {access_token}") == "music-user-token"
+
+
+@pytest.mark.asyncio
+async def test_cached_token_is_rejected_after_it_expires():
+    handler = MCPHandler()
+    access_token = _access_token("music-user-token")
+    access_token_cache[user_cache_key(access_token)] = ("music-user-token", time.time() - 1)
+    
+    assert await handler._extract_user_token(f"Bearer {access_token}") is None
+    assert user_cache_key(access_token) not in access_token_cache
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("header", [
+    None,
+    "",
+    "Basic abc",
+    "Bearer short",
+    "Bearer " + "x" * 60,
+])
+async def test_invalid_authorization_headers_yield_no_user_token(header):
+    assert await MCPHandler()._extract_user_token(header) is None
+    assert len(access_token_cache) == 0
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("scheme", ["Bearer", "bearer", "BEARER"])
+async def test_bearer_scheme_is_case_insensitive(scheme):
+    access_token = _access_token("music-user-token")
+    
+    assert await MCPHandler()._extract_user_token(f"{scheme} {access_token}") == "music-user-token"
+
+
+@pytest.mark.asyncio
+async def test_token_signed_with_another_key_is_rejected():
+    now = int(time.time())
+    forged = jwt.encode(
+        {"apple_user_token": encrypt_token("music-user-token"), "exp": now + 3600},
+        "some-other-secret-key-of-enough-length",
+        algorithm="HS256"
+    )
+    
+    assert await MCPHandler()._extract_user_token(f"Bearer {forged}") is None
+
+
+@pytest.mark.asyncio
+async def test_library_writes_invalidate_cached_stats():
+    totals = {"songs": 10, "playlists": 2}
+    count_requests = []
+    
+    def respond(request: httpx.Request) -> httpx.Response:
+        kind = request.url.path.rsplit("/", 1)[-1]
+        if request.method == "GET":
+            count_requests.append(kind)
+            return httpx.Response(200, json={"data": [], "meta": {"total": totals.get(kind, 0)}})
+        if request.url.path == "/v1/me/library":
+            totals["songs"] += 1
+            return httpx.Response(202)
+        totals["playlists"] += 1
+        return httpx.Response(201, json={"data": [{"id": "p.new"}]})
+    
+    handler = await _handler(respond)
+    stats = await handler.handle_tool_call("get_library_stats", {}, AUTHORIZATION)
+    assert stats["total_songs"] == 10
+    
+    # Served from the cache until a write changes the library
+    assert await handler.handle_tool_call("get_library_stats", {}, AUTHORIZATION) == stats
+    assert len(count_requests) == 4
+    
+    await handler.handle_tool_call("add_to_library", {"song_ids": ["1"]}, AUTHORIZATION)
+    assert (await handler.handle_tool_call("get_library_stats", {}, AUTHORIZATION))["total_songs"] == 11
+    
+    await handler.handle_tool_call("create_playlist", {"name": "Road Trip"}, AUTHORIZATION)
+    assert (await handler.handle_tool_call("get_library_stats", {}, AUTHORIZATION))["total_playlists"] == 3
+    assert len(count_requests) == 12
+
+
+@pytest.mark.asyncio
+async def test_add_to_library_reports_partial_failures():
+    posted = []
+    
+    def respond(request: httpx.Request) -> httpx.Response:
+        ids = [ref["id"] for ref in orjson.loads(request.content)["data"]]
+        posted.append(ids)
+        return httpx.Response(400 if "bad" in ids else 202)
+    
+    song_ids = [str(i) for i in range(150)] + ["bad", "0", "1"]
+    result = await (await _handler(respond)).handle_tool_call(
+        "add_to_library", {"song_ids": song_ids}, AUTHORIZATION
+    )
+    
+    assert result["status"] == "partial"
+    assert result["requested_songs"] == 153
+    assert result["unique_songs"] == 151
+    assert result["added_songs"] == 100
+    assert len(result["errors"]) == 1
+    assert sorted(map(len, posted)) == [51, 100]
+
+
+@pytest.mark.asyncio
+async def test_add_to_library_raises_when_every_batch_fails():
+    respond = lambda request: httpx.Response(400)
+    
+    with pytest.raises(httpx.HTTPStatusError):
+        await (await _handler(respond)).handle_tool_call(
+            "add_to_library", {"song_ids": ["1", "2"]}, AUTHORIZATION
+        )
+
+
+@pytest.mark.asyncio
+async def test_playlist_index_is_cached_until_a_playlist_is_created():
+    playlists = [{"id": "p.1", "attributes": {"name": "Road Trip"}}]
+    playlist_listings = []
+    
+    def respond(request: httpx.Request) -> httpx.Response:
+        path = request.url.path
+        if request.method == "GET" and path == "/v1/me/library/playlists":
+            playlist_listings.append(path)
+            return httpx.Response(200, json={"data": list(playlists)})
+        if request.method == "POST" and path == "/v1/me/library/playlists":
+            playlists.append({"id": "p.2", "attributes": {"name": "Late Night"}})
+            return httpx.Response(201, json={"data": [{"id": "p.2"}]})
+        return httpx.Response(204)
+    
+    handler = await _handler(respond)
+    
+    async def add_to(playlist: str, **options) -> dict:
+        arguments = {"playlist_identifier": playlist, "songs": ["1"], "deduplicate": False, **options}
+        return await handler.handle_tool_call("batch_add_to_playlist", arguments, AUTHORIZATION)
+    
+    assert (await add_to("road trip"))["playlist_id"] == "p.1"
+    assert (await add_to("Road Trip"))["playlist_id"] == "p.1"
+    assert len(playlist_listings) == 1
+    
+    # Creating a playlist drops the cached index, so the next lookup sees it
+    assert (await add_to("Late Night", create_if_missing=True))["playlist_id"] == "p.2"
+    assert (await add_to("late night"))["playlist_id"] == "p.2"
+    assert len(playlist_listings) == 2
+
+
+@pytest.mark.asyncio
+async def test_duplicate_queries_are_searched_once():
+    searched = []
+    
+    def respond(request: httpx.Request) -> httpx.Response:
+        term = request.url.params["term"]
+        searched.append(term)
+        return httpx.Response(200, json={"results": {"library-songs": {"data": [_song(term, "Artist", term)]}}})
+    
+    result = await (await _handler(respond)).handle_tool_call(
+        "efficient_library_search",
+        {"queries": ["Daft Punk", " daft punk", "Justice"], "search_scope": ["library"], "return_format": "ids_only"},
+        AUTHORIZATION
+    )
+    
+    assert sorted(searched) == ["Daft Punk", "Justice"]
+    assert set(result["queries"]) == {"Daft Punk", " daft punk", "Justice"}
+    assert result["queries"][" daft punk"] == result["queries"]["Daft Punk"]
+
+
+@pytest.mark.asyncio
+async def test_auth_failure_aborts_parallel_bulk_operations():
+    finished = []
+    
+    async def respond(request: httpx.Request) -> httpx.Response:
+        name = orjson.loads(request.content)["attributes"]["name"]
+        if name == "Rejected":
+            return httpx.Response(401)
+        await asyncio.sleep(5)
+        finished.append(name)
+        return httpx.Response(201, json={"data": [{"id": "p.slow"}]})
+    
+    operations = [
+        {"operation": "create", "playlist_name": "Slow"},
+        {"operation": "create", "playlist_name": "Rejected"},
+    ]
+    started = time.monotonic()
+    with pytest.raises(httpx.HTTPStatusError) as error:
+        await (await _handler(respond)).handle_tool_call(
+            "bulk_playlist_operations", {"operations": operations, "batch_mode": "parallel"}, AUTHORIZATION
+        )
+    
+    # The sibling operation is cancelled rather than left running
+    assert error.value.response.status_code == 401
+    assert isinstance(error.value.__cause__, ExceptionGroup)
+    assert time.monotonic() - started < 5
+    assert finished == []
+
+
+def test_best_match_prefers_the_closest_artist_and_title():
+    candidates = [
+        _song("1", "Daft Punk", "One More Time (Live)"),
+        _song("2", "Daft Punk", "One More Time"),
+        _song("3", "Cover Band", "One More Time"),
+    ]
+    
+    assert _best_match("Daft Punk One More Time", candidates)["id"] == "2"
+    assert _best_match("daft punk ONE MORE TIME", candidates)["id"] == "2"
+
+
+def test_best_match_keeps_search_order_on_ties():
+    candidates = [_song("1", "Artist", "Song"), _song("2", "Artist", "Song"), {"id": "3"}]
+    
+    assert _best_match("Artist Song", candidates)["id"] == "1"
+    assert _best_match("anything", candidates[:1])["id"] == "1"
@@ -0,0 +1,197 @@
+import base64
+import hashlib
+import sqlite3
+import time
+from urllib.parse import parse_qs, urlparse
+
+import jwt
+import pytest
+from fastapi.testclient import TestClient
+
+from app.core.config import settings
+from app.core.security import seal_payload
+from app.main import app
+
+REDIRECT_URI = "http://localhost:8765/callback"
+VERIFIER = "test-code-verifier-" + "x" * 40
+
+
+@pytest.fixture(scope="module")
+def client():
+    with TestClient(app) as test_client:
+        yield test_client
+
+
+def _challenge(verifier: str) -> str:
+    digest = hashlib.sha256(verifier.encode()).digest()
+    return base64.urlsafe_b64encode(digest).decode().rstrip("=")
+
+
+def _register(client) -> str:
+    response = client.post("/oauth/register", json={"redirect_uris": [REDIRECT_URI]})
+    assert response.status_code == 200, response.text
+    return response.json()["client_id"]
+
+
+def _authorize(client, client_id: str) -> str:
+    response = client.get(
+        "/oauth/authorize",
+        params={
+            "response_type": "code",
+            "client_id": client_id,
+            "redirect_uri": REDIRECT_URI,
+            "code_challenge": _challenge(VERIFIER),
+            "state": "xyz",
+        },
+        follow_redirects=False
+    )
+    assert response.status_code == 302, response.text
+    return parse_qs(urlparse(response.headers["location"]).query)["auth_request_id"][0]
+
+
+def _issue_code(client, auth_request_id: str) -> str:
+    response = client.post(
+        "/oauth/musickit/callback",
+        json={"auth_request_id": auth_request_id, "user_token": "music-user-token"}
+    )
+    assert response.status_code == 200, response.text
+    return parse_qs(urlparse(response.json()["redirect_url"]).query)["code"][0]
+
+
+def _exchange(client, client_id: str, code: str, verifier=VERIFIER):
+    data = {"grant_type": "authorization_code", "code": code, "client_id": client_id}
+    if verifier is not None:
+        data["code_verifier"] = verifier
+    return client.post("/oauth/token", data=data)
+
+
+def _refresh(client, client_id: str, refresh_token: str):
+    return client.post(
+        "/oauth/token",
+        data={"grant_type": "refresh_token", "refresh_token": refresh_token, "client_id": client_id}
+    )
+
+
+def _auth_request(client_id: str) -> dict:
+    return {
+        "client_id": client_id,
+        "redirect_uri": REDIRECT_URI,
+        "scope": "library:read",
+        "state": "xyz",
+        "code_challenge": _challenge(VERIFIER),
+        "code_challenge_method": "S256",
+    }
+
+
+def _expired_auth_request(client_id: str, monkeypatch) -> str:
+    issued_at = time.time() - settings.authorization_code_lifetime - 60
+    with monkeypatch.context() as patch:
+        patch.setattr(time, "time", lambda: issued_at)
+        return seal_payload(_auth_request(client_id))
+
+
+def _rejects_auth_request(client, auth_request_id: str) -> bool:
+    callback = client.post(
+        "/oauth/musickit/callback",
+        json={"auth_request_id": auth_request_id, "user_token": "music-user-token"}
+    )
+    developer_token = client.get("/oauth/musickit/developer-token", params={"auth_request_id": auth_request_id})
+    return callback.status_code == 400 and developer_token.status_code == 400
+
+
+def test_developer_token_requires_pending_authorization_request(client):
+    auth_request_id = _authorize(client, _register(client))
+    
+    assert client.get("/oauth/musickit/developer-token").status_code == 400
+    assert client.get(
+        "/oauth/musickit/developer-token", params={"auth_request_id": "not-a-sealed-request"}
+    ).status_code == 400
+    
+    response = client.get("/oauth/musickit/developer-token", params={"auth_request_id": auth_request_id})
+    assert response.status_code == 200
+    assert response.json()["developer_token"]
+
+
+def test_tampered_auth_request_is_rejected(client):
+    auth_request_id = _authorize(client, _register(client))
+    tampered = auth_request_id[:-6] + ("A" if auth_request_id[-6] != "A" else "B") + auth_request_id[-5:]
+    
+    response = client.post(
+        "/oauth/musickit/callback",
+        json={"auth_request_id": tampered, "user_token": "music-user-token"}
+    )
+    assert response.status_code == 400
+
+
+def test_expired_auth_request_is_rejected(client, monkeypatch):
+    assert _rejects_auth_request(client, _expired_auth_request(_register(client), monkeypatch))
+
+
+def test_token_ciphertext_is_not_accepted_as_auth_request(client):
+    client_id = _register(client)
+    access_token = _exchange(client, client_id, _issue_code(client, _authorize(client, client_id))).json()["access_token"]
+    apple_user_token = jwt.decode(access_token, options={"verify_signature": False})["apple_user_token"]
+    
+    assert _rejects_auth_request(client, apple_user_token)
+    assert _rejects_auth_request(client, apple_user_token.removeprefix("enc:"))
+
+
+def test_sealed_payload_must_be_a_complete_auth_request(client):
+    auth_request = _auth_request(_register(client))
+    del auth_request["code_challenge"]
+    
+    assert _rejects_auth_request(client, seal_payload([1, 2]))
+    assert _rejects_auth_request(client, seal_payload(auth_request))
+
+
+def test_wrong_or_missing_verifier_keeps_code_usable(client):
+    client_id = _register(client)
+    code = _issue_code(client, _authorize(client, client_id))
+    
+    assert _exchange(client, client_id, code, verifier="wrong-verifier-" + "y" * 40).status_code == 400
+    assert _exchange(client, client_id, code, verifier=None).status_code == 400
+    
+    # A failed PKCE check must not consume the code
+    response = _exchange(client, client_id, code)
+    assert response.status_code == 200, response.text
+    assert response.json()["access_token"]
+
+
+def test_code_cannot_be_replayed(client):
+    client_id = _register(client)
+    code = _issue_code(client, _authorize(client, client_id))
+    
+    assert _exchange(client, client_id, code).status_code == 200
+    assert _exchange(client, client_id, code).status_code == 400
+
+
+def test_code_is_bound_to_its_client(client):
+    code = _issue_code(client, _authorize(client, _register(client)))
+    
+    assert _exchange(client, _register(client), code).status_code == 400
+
+
+def test_refresh_fails_once_token_row_is_removed(client):
+    client_id = _register(client)
+    code = _issue_code(client, _authorize(client, client_id))
+    refresh_token = _exchange(client, client_id, code).json()["refresh_token"]
+    
+    # The first refresh warms the in-process refresh token cache
+    assert _refresh(client, client_id, refresh_token).status_code == 200
+    
+    database_path = settings.database_url.removeprefix("sqlite:///")
+    with sqlite3.connect(database_path) as connection:
+        connection.execute("DELETE FROM access_tokens WHERE refresh_token = ?", (refresh_token,))
+    
+    assert _refresh(client, client_id, refresh_token).status_code == 400
+    assert _refresh(client, client_id, refresh_token).status_code == 400
+
+
+def test_refresh_rejects_unknown_token_and_wrong_client(client):
+    client_id = _register(client)
+    code = _issue_code(client, _authorize(client, client_id))
+    refresh_token = _exchange(client, client_id, code).json()["refresh_token"]
+    
+    assert _refresh(client, client_id, "unknown-refresh-token").status_code == 400
+    assert _refresh(client, _register(client), refresh_token).status_code == 400
+    assert _refresh(client, client_id, refresh_token).status_code == 200
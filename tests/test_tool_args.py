@@ -0,0 +1,64 @@
+import httpx
+import pytest
+from pydantic import ValidationError
+
+from app.services.mcp_handler import MCPHandler
+from app.services.tool_args import (
+    AddToLibraryArgs, BulkPlaylistOperationsArgs, EfficientLibrarySearchArgs, RateSongArgs, SearchSongsArgs
+)
+
+
+async def _handler() -> MCPHandler:
+    handler = MCPHandler()
+    # Invalid calls must be rejected before anything reaches Apple Music
+    transport = httpx.MockTransport(lambda request: pytest.fail(f"unexpected request to {request.url}"))
+    await handler.startup(httpx.AsyncClient(transport=transport))
+    return handler
+
+
+def test_defaults_are_filled_and_unknown_keys_ignored():
+    args = SearchSongsArgs.model_validate({"query": "Daft Punk", "unexpected": True})
+    
+    assert args.query == "Daft Punk"
+    assert args.limit == 10
+
+
+@pytest.mark.parametrize("model, arguments", [
+    (SearchSongsArgs, {}),
+    (AddToLibraryArgs, {"song_ids": "1"}),
+    (RateSongArgs, {"song_id": "1"}),
+])
+def test_missing_or_mistyped_arguments_are_rejected(model, arguments):
+    with pytest.raises(ValidationError):
+        model.model_validate(arguments)
+
+
+@pytest.mark.parametrize("model, arguments", [
+    (RateSongArgs, {"song_id": "1", "rating": 0}),
+    (RateSongArgs, {"song_id": "1", "rating": 6}),
+    (BulkPlaylistOperationsArgs, {"operations": [], "batch_mode": "sideways"}),
+    (EfficientLibrarySearchArgs, {"queries": ["x"], "search_scope": ["everywhere"]}),
+    (EfficientLibrarySearchArgs, {"queries": ["x"], "types": ["podcasts"]}),
+    (EfficientLibrarySearchArgs, {"queries": ["x"], "return_format": "verbose"}),
+])
+def test_schema_constraints_are_enforced(model, arguments):
+    with pytest.raises(ValidationError):
+        model.model_validate(arguments)
+
+
+@pytest.mark.asyncio
+async def test_invalid_tool_call_is_a_value_error():
+    handler = await _handler()
+    
+    with pytest.raises(ValueError, match="Invalid arguments for search_songs: query"):
+        await handler.handle_tool_call("search_songs", {"limit": 5})
+    with pytest.raises(ValueError, match="Unknown tool"):
+        await handler.handle_tool_call("no_such_tool", {})
+
+
+@pytest.mark.asyncio
+async def test_out_of_range_rating_never_reaches_apple_music():
+    handler = await _handler()
+    
+    with pytest.raises(ValueError, match="rating"):
+        await handler.handle_tool_call("rate_song", {"song_id": "1", "rating": 6})